@@ -0,0 +1,96 @@
+import os
+import random
+from dataclasses import dataclass
+from typing import List
+
+
+@dataclass
+class CorpusSpec:
+    files: int = 50
+    blocks_per_file: int = 20
+    depth: int = 2
+    documented_share: float = 0.3
+    large_files: int = 1
+    large_file_blocks: int = 2000
+    seed: int = 0
+
+
+class CorpusGenerator:
+    def __init__(self, spec: CorpusSpec) -> None:
+        self.spec = spec
+        self._rng = random.Random(spec.seed)
+        self._counter = 0
+
+    def _name(self, prefix: str) -> str:
+        self._counter += 1
+        return f"{prefix}_{self._counter}"
+
+    def _docstring(self, indent: str) -> List[str]:
+        if self._rng.random() >= self.spec.documented_share:
+            return []
+        if self._rng.random() < 0.5:
+            return [f'{indent}"""Existing one line summary."""\n']
+        return [
+            f'{indent}"""\n',
+            f"{indent}Existing summary.\n",
+            "\n",
+            f"{indent}Args:\n",
+            f"{indent}    value: An input value.\n",
+            f'{indent}"""\n',
+        ]
+
+    def _function(self, indent: str, depth: int, method: bool = False) -> List[str]:
+        body = indent + "    "
+        args = "self, value" if method else "value"
+        lines = [f"{indent}def {self._name('func')}({args}):\n"]
+        lines += self._docstring(body)
+        lines += [
+            f"{body}total = 0\n",
+            f"{body}for index in range(value):\n",
+            f"{body}    total += index * {self._rng.randint(1, 9)}\n",
+        ]
+        if depth > 0 and self._rng.random() < 0.5:
+            lines += self._function(body, depth - 1)
+        lines += [f"{body}return total\n", "\n"]
+        return lines
+
+    def _class(self, indent: str, depth: int, methods: int) -> List[str]:
+        body = indent + "    "
+        lines = [f"{indent}class {self._name('Klass')}:\n"]
+        lines += self._docstring(body)
+        lines += [f"{body}limit = {self._rng.randint(1, 100)}\n", "\n"]
+        for _ in range(max(methods, 1)):
+            lines += self._function(body, depth - 1, method=True)
+        if depth > 1 and self._rng.random() < 0.3:
+            lines += self._class(body, depth - 1, 1)
+        return lines
+
+    def module_source(self, blocks: int) -> str:
+        lines = ["#!/usr/bin/env python3\n"]
+        lines += self._docstring("")
+        lines += ["import os\n", "\n", "\n"]
+        remaining = blocks
+        while remaining > 0:
+            if self._rng.random() < 0.3:
+                methods = min(remaining - 1, self._rng.randint(1, 5))
+                lines += self._class("", self.spec.depth, methods)
+                remaining -= methods + 1
+            else:
+                lines += self._function("", self.spec.depth)
+                remaining -= 1
+            lines.append("\n")
+        return "".join(lines)
+
+    def write(self, target_dir: str) -> List[str]:
+        paths = []
+        for index in range(self.spec.files):
+            package = os.path.join(target_dir, f"pkg_{index % 10}")
+            os.makedirs(package, exist_ok=True)
+            paths.append(os.path.join(package, f"module_{index}.py"))
+            with open(paths[-1], "w", encoding="utf8") as f:
+                f.write(self.module_source(self.spec.blocks_per_file))
+        for index in range(self.spec.large_files):
+            paths.append(os.path.join(target_dir, f"large_{index}.py"))
+            with open(paths[-1], "w", encoding="utf8") as f:
+                f.write(self.module_source(self.spec.large_file_blocks))
+        return paths
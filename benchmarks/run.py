@@ -0,0 +1,210 @@
+# Run from the repository root as `python -m benchmarks.run`. Timings are
+# only comparable on one machine, so no baseline ships with the repository:
+# record one with --update-baseline before changing anything, later runs
+# compare against it.
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from typing import Callable, Dict, List
+
+from benchmarks.corpus import CorpusGenerator, CorpusSpec
+from client.fake import FakeBackend
+from core.app import App
+from models import blocks
+from parsers.py_parser import PythonParser
+
+PARSER_PHASES = (
+    "parse_file",
+    "remove_doc_strings",
+    "embed_documentation",
+    "write_to_file",
+)
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def time_parser_phases(paths: List[str]) -> Dict[str, float]:
+    totals = {phase: 0.0 for phase in PARSER_PHASES}
+    for path in paths:
+        parser = PythonParser(path)
+        for phase in PARSER_PHASES:
+            start = time.perf_counter()
+            getattr(parser, phase)()
+            totals[phase] += time.perf_counter() - start
+    return totals
+
+
+def best_of(repeat: int, corpus_dir: str, measure: Callable[[str], Dict[str, float]]):
+    best: Dict[str, float] = {}
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as work_dir:
+            target = os.path.join(work_dir, "corpus")
+            shutil.copytree(corpus_dir, target)
+            # the pipeline prints per file, keep that out of the timings
+            with contextlib.redirect_stdout(io.StringIO()):
+                results = measure(target)
+        for key, value in results.items():
+            best[key] = min(best.get(key, value), value)
+    return best
+
+
+def measure_corpus(target: str) -> Dict[str, float]:
+    paths = sorted(
+        os.path.join(root, file)
+        for root, _, files in os.walk(target)
+        for file in files
+        if file.endswith(".py") and not file.startswith("large_")
+    )
+    large_paths = sorted(
+        os.path.join(target, file)
+        for file in os.listdir(target)
+        if file.startswith("large_")
+    )
+    results = {
+        f"parser.{phase}": seconds
+        for phase, seconds in time_parser_phases(paths).items()
+    }
+    results.update(
+        {
+            f"large_file.{phase}": seconds
+            for phase, seconds in time_parser_phases(large_paths).items()
+        }
+    )
+    return results
+
+
+def measure_directory(
+    num_workers: int, parse_workers: int
+) -> Callable[[str], Dict[str, float]]:
+    def measure(target: str) -> Dict[str, float]:
+        app = App(
+            target_dir_name=target,
+            num_workers=num_workers,
+            parse_workers=parse_workers,
+            replace_docs=True,
+            no_cache=True,
+        )
+        start = time.perf_counter()
+        app.process_directory()
+        return {"app.process_directory": time.perf_counter() - start}
+
+    return measure
+
+
+def compare(
+    results: Dict[str, float], baseline: Dict[str, float], threshold: float
+) -> List[str]:
+    regressions = []
+    print(f"{'benchmark':<36}{'baseline':>12}{'current':>12}{'change':>10}")
+    for key, current in sorted(results.items()):
+        previous = baseline.get(key)
+        if previous is None:
+            print(f"{key:<36}{'-':>12}{current:>12.4f}{'new':>10}")
+            continue
+        change = (current - previous) / previous if previous else 0.0
+        print(f"{key:<36}{previous:>12.4f}{current:>12.4f}{change:>+10.1%}")
+        if change > threshold:
+            regressions.append(key)
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.run",
+        description="Benchmark the documentation pipeline.",
+    )
+    parser.add_argument("--files", type=int, default=CorpusSpec.files)
+    parser.add_argument("--blocks", type=int, default=CorpusSpec.blocks_per_file)
+    parser.add_argument("--depth", type=int, default=CorpusSpec.depth)
+    parser.add_argument("--documented", type=float, default=CorpusSpec.documented_share)
+    parser.add_argument("--large-files", type=int, default=CorpusSpec.large_files)
+    parser.add_argument(
+        "--large-blocks", type=int, default=CorpusSpec.large_file_blocks
+    )
+    parser.add_argument("--seed", type=int, default=CorpusSpec.seed)
+    parser.add_argument("-T", dest="num_workers", type=int, default=4)
+    # fixed rather than one per core, so the result does not follow the machine
+    parser.add_argument("-P", dest="parse_workers", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", type=str, help="Write results as JSON")
+    parser.add_argument("--baseline", type=str, default=DEFAULT_BASELINE)
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Fail when a benchmark is slower than baseline by this fraction",
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Store these results as the new baseline",
+    )
+    args = parser.parse_args()
+
+    spec = CorpusSpec(
+        files=args.files,
+        blocks_per_file=args.blocks,
+        depth=args.depth,
+        documented_share=args.documented,
+        large_files=args.large_files,
+        large_file_blocks=args.large_blocks,
+        seed=args.seed,
+    )
+    # zero latency stand-in, so only the pipeline itself is measured
+    blocks.client.backend = FakeBackend()
+
+    with tempfile.TemporaryDirectory() as corpus_dir:
+        CorpusGenerator(spec).write(corpus_dir)
+        results = best_of(args.repeat, corpus_dir, measure_corpus)
+        results.update(
+            best_of(
+                args.repeat,
+                corpus_dir,
+                measure_directory(args.num_workers, args.parse_workers),
+            )
+        )
+
+    report = {
+        "meta": {
+            "corpus": asdict(spec),
+            "num_workers": args.num_workers,
+            "parse_workers": args.parse_workers,
+            "repeat": args.repeat,
+            "python": platform.python_version(),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as f:
+            json.dump(report, f, indent=2)
+
+    regressions: List[str] = []
+    if os.path.isfile(args.baseline) and not args.update_baseline:
+        with open(args.baseline, "r", encoding="utf8") as f:
+            baseline = json.load(f)
+        if baseline.get("meta") != report["meta"]:
+            print("Warning: baseline was recorded with different settings")
+        regressions = compare(results, baseline["results"], args.threshold)
+    else:
+        compare(results, {}, args.threshold)
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+
+    if regressions:
+        print(f"Regressions over {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# Run from the repository root as `python -m benchmarks.startup`
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MAIN = os.path.join(REPO_ROOT, "main.py")
+
+SAMPLE = '''import os
+
+
+def add(a, b):
+    """Adds two values."""
+    return a + b
+'''
+
+# modules that must never load for runs that do not call the model
+HEAVY_MODULES = ("openai", "httpx", "pydantic")
+
+
+def parse_importtime(stderr: str) -> List[Tuple[int, int, str]]:
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        imports.append((int(self_us), int(cumulative_us), name.rstrip()))
+    return imports
+
+
+def time_command(command: List[str], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.startup", description="Measure CLI startup time."
+    )
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument(
+        "--max-overhead-ms",
+        type=float,
+        help="Fail when a removal run exceeds bare interpreter startup by this much",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        target = os.path.join(work_dir, "sample.py")
+        scenarios = {
+            "remove (-R)": [MAIN, "-R", "-F", target],
+            "dry run": [MAIN, "--dry-run", "-F", target],
+        }
+
+        bare = time_command([sys.executable, "-c", "pass"], args.repeat)
+        print(f"{'interpreter':<16}{bare * 1000:>10.1f} ms")
+
+        failed = False
+        for name, command in scenarios.items():
+            with open(target, "w", encoding="utf8") as f:
+                f.write(SAMPLE)
+            elapsed = time_command([sys.executable, *command], args.repeat)
+            overhead_ms = (elapsed - bare) * 1000
+            print(f"{name:<16}{elapsed * 1000:>10.1f} ms  (+{overhead_ms:.1f} ms)")
+            if args.max_overhead_ms is not None and overhead_ms > args.max_overhead_ms:
+                failed = True
+
+            result = subprocess.run(
+                [sys.executable, "-X", "importtime", *command],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                text=True,
+                check=True,
+            )
+            imports = parse_importtime(result.stderr)
+            heavy = sorted(
+                {
+                    module.strip().split(".")[0]
+                    for _, _, module in imports
+                    if module.strip().split(".")[0] in HEAVY_MODULES
+                }
+            )
+            if heavy:
+                failed = True
+                print(f"  unexpected imports: {', '.join(heavy)}")
+            for self_us, cumulative_us, module in sorted(
+                imports, key=lambda item: item[1], reverse=True
+            )[: args.top]:
+                print(f"  {cumulative_us / 1000:>8.1f} ms  {module}")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
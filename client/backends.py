@@ -0,0 +1,65 @@
+import abc
+from typing import Dict, List, Tuple
+
+from client.schema import Completion, Prompt
+
+
+class BackendError(Exception):
+    def __init__(
+        self,
+        message: str,
+        status_code: int | None = None,
+        retry_after: float | None = None,
+    ) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def is_rate_limit(self) -> bool:
+        return self.status_code == 429
+
+    # the request itself was refused, a differently shaped one may still pass,
+    # unlike a rate limit, a timeout or missing credentials
+    @property
+    def is_rejected(self) -> bool:
+        return self.status_code in (400, 404, 405, 415, 422)
+
+
+class AsyncSession(metaclass=abc.ABCMeta):
+
+    @abc.abstractmethod
+    async def complete(
+        self, model: str, messages: List[Prompt], **kwargs
+    ) -> Completion:
+        pass
+
+    @abc.abstractmethod
+    async def close(self) -> None:
+        pass
+
+
+class Backend(metaclass=abc.ABCMeta):
+
+    @abc.abstractmethod
+    def complete(self, model: str, messages: List[Prompt], **kwargs) -> Completion:
+        pass
+
+    # async clients are bound to the event loop they were first used in,
+    # AiClient opens one session per backend on its own long lived loop
+    @abc.abstractmethod
+    def open_session(self) -> AsyncSession:
+        pass
+
+    # Batch endpoints trade latency for price. Each request pairs a custom id
+    # with its messages, results map those ids to their content once the
+    # batch has finished and are None while it is still running.
+    @abc.abstractmethod
+    def submit_batch(
+        self, model: str, requests: List[Tuple[str, List[Prompt]]], **kwargs
+    ) -> str:
+        pass
+
+    @abc.abstractmethod
+    def batch_results(self, batch_id: str) -> Dict[str, str] | None:
+        pass
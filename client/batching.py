@@ -0,0 +1,63 @@
+import json
+import re
+from typing import Dict, List, Tuple
+
+BATCH_REQUEST_HEADER = "### Request id: "
+
+BATCH_INSTRUCTIONS = """
+Answer each of the requests below independently.
+Respond only with a JSON object whose keys are the request ids and whose
+values are the plain text answers, exactly as they would be answered alone.
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    # roughly four characters per token for English text and code
+    return len(text) // 4 + 1
+
+
+def pack_batches(
+    messages: List[Tuple[str, str]], token_budget: int, max_items: int
+) -> List[List[Tuple[str, str]]]:
+    batches: List[List[Tuple[str, str]]] = []
+    current: List[Tuple[str, str]] = []
+    current_tokens = 0
+    for message_id, message in messages:
+        tokens = estimate_tokens(message)
+        if current and (
+            current_tokens + tokens > token_budget or len(current) >= max_items
+        ):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append((message_id, message))
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def build_batch_message(batch: List[Tuple[str, str]]) -> str:
+    requests = "\n".join(
+        f"{BATCH_REQUEST_HEADER}{message_id}\n{message}"
+        for message_id, message in batch
+    )
+    return f"{BATCH_INSTRUCTIONS}\n{requests}"
+
+
+def split_batch_message(message: str) -> List[Tuple[str, str]]:
+    parts = re.split(rf"^{re.escape(BATCH_REQUEST_HEADER)}(\S+)\n", message, flags=re.M)
+    return [(parts[index], parts[index + 1]) for index in range(1, len(parts) - 1, 2)]
+
+
+def parse_batch_response(content: str, message_ids: List[str]) -> Dict[str, str]:
+    try:
+        data = json.loads(content)
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return {
+        message_id: data[message_id].strip()
+        for message_id in message_ids
+        if isinstance(data.get(message_id), str) and data[message_id].strip()
+    }
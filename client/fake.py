@@ -0,0 +1,159 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import time
+from threading import Lock
+from typing import Dict, List, Tuple
+
+from client.backends import AsyncSession, Backend, BackendError
+from client.batching import estimate_tokens, split_batch_message
+from client.schema import Completion, Prompt
+
+NAME_PATTERN = re.compile(r"named '([^']*)'")
+
+
+class LatencyModel:
+    KINDS = ("fixed", "uniform", "exponential", "lognormal")
+
+    def __init__(self, kind: str = "fixed", *params: float) -> None:
+        if kind not in LatencyModel.KINDS:
+            raise ValueError(f"Unknown latency distribution {kind}")
+        self.kind = kind
+        self.params = params or (0.0,)
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyModel":
+        # fixed:SECONDS, uniform:LOW:HIGH, exponential:MEAN, lognormal:MEDIAN:SIGMA
+        kind, *params = spec.split(":")
+        return cls(kind, *(float(param) for param in params))
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "uniform":
+            return rng.uniform(self.params[0], self.params[1])
+        if self.kind == "exponential":
+            return rng.expovariate(1 / self.params[0]) if self.params[0] else 0.0
+        if self.kind == "lognormal":
+            return rng.lognormvariate(math.log(self.params[0]), self.params[1])
+        return self.params[0]
+
+
+class FakeResponder:
+    def __init__(
+        self,
+        latency: LatencyModel | None = None,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after: float = 1.0,
+        seed: int = 0,
+    ) -> None:
+        self.latency = latency or LatencyModel()
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self._rng = random.Random(seed)
+        self._lock = Lock()
+
+    @classmethod
+    def from_options(cls, options: str) -> "FakeResponder":
+        # e.g. "latency=uniform:0.1:0.5,error_rate=0.01,rate_limit_rate=0.05"
+        kwargs: Dict = {}
+        for option in filter(None, options.split(",")):
+            key, _, value = option.partition("=")
+            if key == "latency":
+                kwargs[key] = LatencyModel.parse(value)
+            elif key == "seed":
+                kwargs[key] = int(value)
+            elif key in ("error_rate", "rate_limit_rate", "retry_after"):
+                kwargs[key] = float(value)
+            else:
+                raise ValueError(f"Unknown fake backend option {key}")
+        return cls(**kwargs)
+
+    def plan(self) -> Tuple[float, BackendError | None]:
+        with self._lock:
+            delay = self.latency.sample(self._rng)
+            roll = self._rng.random()
+        if roll < self.rate_limit_rate:
+            return delay, BackendError("Rate limit reached", 429, self.retry_after)
+        if roll < self.rate_limit_rate + self.error_rate:
+            return delay, BackendError("Injected server error", 500)
+        return delay, None
+
+    def _answer(self, message: str) -> str:
+        match = NAME_PATTERN.search(message)
+        name = match.group(1) if match else "object"
+        digest = hashlib.sha256(message.strip().encode("utf8")).hexdigest()[:8]
+        return f"Stand-in documentation for {name}.\n\nFingerprint: {digest}."
+
+    def respond(self, messages: List[Prompt], **kwargs) -> Completion:
+        message = messages[-1]["content"]
+        if (kwargs.get("response_format") or {}).get("type") == "json_object":
+            content = json.dumps(
+                {
+                    message_id: self._answer(request)
+                    for message_id, request in split_batch_message(message)
+                }
+            )
+        else:
+            content = self._answer(message)
+        return Completion(
+            content=content,
+            prompt_tokens=sum(
+                estimate_tokens(prompt["content"]) for prompt in messages
+            ),
+            completion_tokens=estimate_tokens(content),
+        )
+
+
+class FakeSession(AsyncSession):
+    def __init__(self, responder: FakeResponder) -> None:
+        self._responder = responder
+
+    async def complete(
+        self, model: str, messages: List[Prompt], **kwargs
+    ) -> Completion:
+        delay, error = self._responder.plan()
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return self._responder.respond(messages, **kwargs)
+
+    async def close(self) -> None:
+        pass
+
+
+class FakeBackend(Backend):
+    def __init__(self, responder: FakeResponder | None = None) -> None:
+        self.responder = responder or FakeResponder()
+        # batches live as long as the backend, a new process finds none of them
+        self._batches: Dict[str, Dict[str, str]] = {}
+
+    def complete(self, model: str, messages: List[Prompt], **kwargs) -> Completion:
+        delay, error = self.responder.plan()
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        return self.responder.respond(messages, **kwargs)
+
+    def open_session(self) -> AsyncSession:
+        return FakeSession(self.responder)
+
+    def submit_batch(
+        self, model: str, requests: List[Tuple[str, List[Prompt]]], **kwargs
+    ) -> str:
+        # unique across backends, one job file may hold batches of several
+        batch_id = f"batch-stand-in-{os.urandom(6).hex()}"
+        self._batches[batch_id] = {
+            custom_id: self.responder.respond(messages).content
+            for custom_id, messages in requests
+        }
+        return batch_id
+
+    def batch_results(self, batch_id: str) -> Dict[str, str] | None:
+        if batch_id not in self._batches:
+            raise BackendError(f"No such batch: {batch_id}", 404)
+        return self._batches[batch_id]
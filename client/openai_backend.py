@@ -0,0 +1,138 @@
+import json
+from typing import Dict, List, Tuple
+
+import httpx
+import openai
+from openai import AsyncOpenAI, OpenAI
+
+from client.backends import AsyncSession, Backend, BackendError
+from client.schema import Completion, Prompt
+
+
+def _to_completion(response) -> Completion:
+    usage = response.usage
+    return Completion(
+        content=response.choices[0].message.content or "",
+        prompt_tokens=usage.prompt_tokens if usage else 0,
+        completion_tokens=usage.completion_tokens if usage else 0,
+    )
+
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+BATCH_RUNNING = ("validating", "in_progress", "finalizing", "cancelling")
+
+
+def _to_backend_error(error: openai.OpenAIError) -> BackendError:
+    if isinstance(error, openai.APIStatusError):
+        retry_after = error.response.headers.get("retry-after")
+        try:
+            retry_seconds = float(retry_after) if retry_after else None
+        except ValueError:
+            retry_seconds = None
+        return BackendError(str(error), error.status_code, retry_seconds)
+    return BackendError(str(error))
+
+
+class OpenAISession(AsyncSession):
+    def __init__(self, client: AsyncOpenAI) -> None:
+        self._client = client
+
+    async def complete(
+        self, model: str, messages: List[Prompt], **kwargs
+    ) -> Completion:
+        try:
+            response = await self._client.chat.completions.create(
+                messages=messages,  # type: ignore
+                model=model,
+                **kwargs,
+            )
+        except (openai.APIStatusError, openai.APIConnectionError) as e:
+            raise _to_backend_error(e) from e
+        return _to_completion(response)
+
+    async def close(self) -> None:
+        await self._client.close()
+
+
+class OpenAIBackend(Backend):
+    def __init__(self, api_key: str | None = None, base_url: str | None = None) -> None:
+        self._api_key = api_key
+        self._base_url = base_url
+        # the OpenAI client is safe to share between worker threads, retries
+        # are left to the RequestScheduler so they respect the shared limits
+        self._client = OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+
+    def complete(self, model: str, messages: List[Prompt], **kwargs) -> Completion:
+        try:
+            response = self._client.chat.completions.create(
+                messages=messages,  # type: ignore
+                model=model,
+                **kwargs,
+            )
+        except (openai.APIStatusError, openai.APIConnectionError) as e:
+            raise _to_backend_error(e) from e
+        return _to_completion(response)
+
+    def open_session(self) -> AsyncSession:
+        return OpenAISession(
+            AsyncOpenAI(api_key=self._api_key, base_url=self._base_url, max_retries=0)
+        )
+
+    # the batch routes are called directly, they are not wrapped by every
+    # client version this runs against
+    def submit_batch(
+        self, model: str, requests: List[Tuple[str, List[Prompt]]], **kwargs
+    ) -> str:
+        lines = "".join(
+            json.dumps(
+                {
+                    "custom_id": custom_id,
+                    "method": "POST",
+                    "url": BATCH_ENDPOINT,
+                    "body": {"model": model, "messages": messages, **kwargs},
+                }
+            )
+            + "\n"
+            for custom_id, messages in requests
+        )
+        try:
+            input_file = self._client.files.create(
+                file=("auto_doc_batch.jsonl", lines.encode("utf8")),
+                purpose="batch",  # type: ignore
+            )
+            response = self._client.post(
+                "/batches",
+                body={
+                    "input_file_id": input_file.id,
+                    "endpoint": BATCH_ENDPOINT,
+                    "completion_window": "24h",
+                },
+                cast_to=httpx.Response,
+            )
+        except (openai.APIStatusError, openai.APIConnectionError) as e:
+            raise _to_backend_error(e) from e
+        return response.json()["id"]
+
+    def batch_results(self, batch_id: str) -> Dict[str, str] | None:
+        try:
+            batch = self._client.get(
+                f"/batches/{batch_id}", cast_to=httpx.Response
+            ).json()
+            if batch["status"] in BATCH_RUNNING:
+                return None
+            # failed and expired batches may have answered nothing
+            if not batch.get("output_file_id"):
+                return {}
+            output = self._client.files.content(batch["output_file_id"]).text
+        except (openai.APIStatusError, openai.APIConnectionError) as e:
+            raise _to_backend_error(e) from e
+
+        results = {}
+        for line in output.splitlines():
+            entry = json.loads(line)
+            response = entry.get("response") or {}
+            if response.get("status_code") == 200:
+                message = response["body"]["choices"][0]["message"]
+                results[entry["custom_id"]] = (message.get("content") or "").strip()
+        return results
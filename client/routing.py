@@ -0,0 +1,90 @@
+import json
+from dataclasses import dataclass, field, fields
+from typing import Dict, List, Tuple
+
+
+@dataclass(slots=True)
+class Route:
+    name: str
+    model: str
+    # a create_backend spec and endpoint, e.g. a local OpenAI compatible server
+    backend: str = "openai"
+    base_url: str | None = None
+    max_tokens: int | None = None
+    # requests in flight on this route across the whole run, None keeps the
+    # per file -C limit
+    max_concurrency: int | None = None
+
+
+@dataclass(slots=True)
+class RouteRule:
+    route: str
+    obj_types: Tuple[str, ...] = ()
+    min_lines: int = 0
+    max_lines: int | None = None
+    # how many levels of blocks are nested inside, 0 for a leaf
+    min_height: int = 0
+    max_height: int | None = None
+
+    def matches(self, obj_type: str, lines: int, height: int) -> bool:
+        return (
+            (not self.obj_types or obj_type in self.obj_types)
+            and lines >= self.min_lines
+            and (self.max_lines is None or lines <= self.max_lines)
+            and height >= self.min_height
+            and (self.max_height is None or height <= self.max_height)
+        )
+
+
+# Picks the route of each block from the first rule it matches, blocks no
+# rule matches take the default route, or the client's own model if there is
+# none. Loaded from a JSON file:
+#
+# {
+#   "routes": {
+#     "fast": {"model": "gpt-4o-mini", "max_tokens": 200, "max_concurrency": 16,
+#              "base_url": "http://127.0.0.1:8000/v1"},
+#     "strong": {"model": "gpt-4o", "max_tokens": 800, "max_concurrency": 4}
+#   },
+#   "rules": [
+#     {"route": "strong", "obj_types": ["module"]},
+#     {"route": "strong", "obj_types": ["class"], "min_lines": 150},
+#     {"route": "fast", "max_lines": 40, "max_height": 0}
+#   ],
+#   "default": "strong"
+# }
+@dataclass(slots=True)
+class Router:
+    routes: Dict[str, Route]
+    rules: List[RouteRule] = field(default_factory=list)
+    default: str | None = None
+
+    def __post_init__(self) -> None:
+        for name in [rule.route for rule in self.rules] + [self.default]:
+            if name is not None and name not in self.routes:
+                raise ValueError(f"Unknown route {name}")
+
+    @classmethod
+    def load(cls, path: str) -> "Router":
+        with open(path, "r", encoding="utf8") as f:
+            config = json.load(f)
+        route_keys = {option.name for option in fields(Route)} - {"name"}
+        rule_keys = {option.name for option in fields(RouteRule)}
+        routes = {}
+        for name, options in config.get("routes", {}).items():
+            if unknown := options.keys() - route_keys:
+                raise ValueError(f"Unknown options {sorted(unknown)} in route {name}")
+            routes[name] = Route(name=name, **options)
+        rules = []
+        for options in config.get("rules", []):
+            if unknown := options.keys() - rule_keys:
+                raise ValueError(f"Unknown options {sorted(unknown)} in routing rule")
+            options["obj_types"] = tuple(options.get("obj_types", ()))
+            rules.append(RouteRule(**options))
+        return cls(routes, rules, config.get("default"))
+
+    def route(self, obj_type: str, lines: int, height: int) -> str | None:
+        for rule in self.rules:
+            if rule.matches(obj_type, lines, height):
+                return rule.route
+        return self.default
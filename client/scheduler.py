@@ -0,0 +1,123 @@
+import random
+import time
+from threading import Lock
+
+from client.backends import BackendError
+from client.schema import Completion
+
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+class CircuitOpenError(BackendError):
+    pass
+
+
+class TokenBucket:
+    def __init__(self, per_minute: int) -> None:
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self._tokens = float(per_minute)
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    # takes the tokens immediately, possibly into debt, and returns how long
+    # the caller has to wait for the debt to be paid back
+    def reserve(self, cost: float, now: float) -> float:
+        self._refill(now)
+        self._tokens -= cost
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def refund(self, amount: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + amount)
+
+
+class RequestScheduler:
+    def __init__(
+        self,
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+        max_retries: int = 5,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        failure_threshold: int = 5,
+        cooldown: float = 30.0,
+    ) -> None:
+        self._requests = (
+            TokenBucket(requests_per_minute) if requests_per_minute else None
+        )
+        self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = Lock()
+        self._rng = random.Random()
+        self._paused_until = 0.0
+        self._failures = 0
+        self._open_until = 0.0
+
+    def acquire(self, estimated_tokens: int) -> float:
+        with self._lock:
+            now = time.monotonic()
+            if self._failures >= self.failure_threshold:
+                if now < self._open_until:
+                    raise CircuitOpenError(
+                        f"Circuit open after {self._failures} consecutive failures, "
+                        f"retrying in {self._open_until - now:.1f}s"
+                    )
+                # half open, this request probes the backend while the rest
+                # keep failing fast, its outcome closes or reopens the circuit.
+                # A probe that never reports back is replaced after a cooldown
+                self._open_until = now + self.cooldown
+            delay = max(0.0, self._paused_until - now)
+            if self._requests is not None:
+                delay = max(delay, self._requests.reserve(1, now))
+            if self._tokens is not None:
+                delay = max(delay, self._tokens.reserve(estimated_tokens, now))
+            return delay
+
+    def on_success(self, estimated_tokens: int, completion: Completion) -> None:
+        with self._lock:
+            self._failures = 0
+            used = completion.prompt_tokens + completion.completion_tokens
+            if self._tokens is not None and used:
+                self._tokens.refund(estimated_tokens - used)
+
+    def _backoff(self, attempt: int) -> float:
+        # full jitter keeps workers that failed together from retrying together
+        ceiling = min(self.backoff_max, self.backoff_base * 2**attempt)
+        return self._rng.uniform(0, ceiling)
+
+    def on_failure(self, error: BackendError, attempt: int) -> float | None:
+        retryable = (
+            error.status_code is None
+            or error.status_code >= 500
+            or error.status_code in RETRYABLE_STATUS_CODES
+        )
+        # only an unreachable or failing backend trips the circuit, any other
+        # answer shows it is up
+        outage = error.status_code is None or error.status_code >= 500
+        with self._lock:
+            now = time.monotonic()
+            if outage:
+                self._failures += 1
+                if self._failures >= self.failure_threshold:
+                    self._open_until = now + self.cooldown
+            else:
+                self._failures = 0
+            if not retryable or attempt >= self.max_retries:
+                return None
+
+            delay = self._backoff(attempt)
+            if error.is_rate_limit:
+                if error.retry_after is not None:
+                    delay = error.retry_after
+                # every worker waits out a rate limit, not only the one that hit it
+                self._paused_until = max(self._paused_until, now + delay)
+            return delay
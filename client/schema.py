@@ -0,0 +1,17 @@
+from dataclasses import dataclass
+from typing import TypedDict
+
+Prompt = TypedDict(
+    "Prompt",
+    {
+        "role": str,
+        "content": str,
+    },
+)
+
+
+@dataclass
+class Completion:
+    content: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
@@ -1,42 +1,416 @@
 import os
-from typing import List, TypedDict
+import time
+from threading import Lock, Thread
+from typing import Any, Coroutine, Dict, List, Set, Tuple
 
-from openai import OpenAI
-
-Prompt = TypedDict(
-    "Prompt",
-    {
-        "role": str,
-        "content": str,
-    },
+from client.backends import AsyncSession, Backend, BackendError
+from client.batching import (
+    build_batch_message,
+    estimate_tokens,
+    pack_batches,
+    parse_batch_response,
 )
+from client.cache import ResponseCache
+from client.routing import Route, Router
+from client.scheduler import RequestScheduler
+from client.schema import Completion, Prompt
+
+
+def create_backend(spec: str = "openai", base_url: str | None = None) -> Backend:
+    # "openai" or "fake[:OPTIONS]", see FakeResponder.from_options. Backends
+    # are imported here so runs that never call a model never load openai.
+    kind, _, options = spec.partition(":")
+    if kind == "openai":
+        from client.openai_backend import OpenAIBackend
+
+        return OpenAIBackend(
+            api_key=os.environ.get("OPENAI_API_KEY"), base_url=base_url
+        )
+    if kind == "fake":
+        from client.fake import FakeBackend, FakeResponder
+
+        return FakeBackend(FakeResponder.from_options(options))
+    raise ValueError(f"Unsupported backend {kind}")
 
 
 class AiClient:
 
-    def __init__(self, prompt: Prompt, model="gpt-3.5-turbo") -> None:
+    def __init__(
+        self, prompt: Prompt, model="gpt-3.5-turbo", backend: Backend | None = None
+    ) -> None:
         self._prompt: Prompt = prompt
         self._model = model
         self._messages: List[Prompt] = [prompt]
-        self._client = self._create_client()
+        self._messages_lock = Lock()
+        self._backend = backend
+        self._backend_spec = "openai"
+        self._base_url: str | None = None
+        self._backend_lock = Lock()
+        # blocks are sent to the client's own model unless a router is set
+        self.router: Router | None = None
+        # backends of routes with an endpoint of their own, by spec and url
+        self._route_backends: Dict[Tuple[str, str | None], Backend] = {}
+        self.cache: ResponseCache | None = None
+        # shared by every worker thread and event loop using this client
+        self.scheduler = RequestScheduler()
+        # core.metrics.Metrics, attached by App for the duration of a run
+        self.metrics = None
+        # every worker thread's requests run on one event loop, so each backend
+        # keeps one async session and its connections warm for the process
+        self._loop = None
+        self._loop_thread: Thread | None = None
+        self._loop_lock = Lock()
+        self._sessions: Dict[Backend, AsyncSession] = {}
+        # the max_concurrency of each route holds across every file and worker,
+        # by route name and limit, only ever used on the event loop
+        self._route_limits: Dict[Tuple[str, int], Any] = {}
+        # routes whose endpoint refused a batched request, sent block by block
+        self._unbatched_routes: Set[str | None] = set()
 
-    def _create_client(self):
-        api_key = os.environ.get("OPENAI_API_KEY")
-        client = OpenAI(api_key=api_key)
-        return client
+    @property
+    def backend(self) -> Backend:
+        # built on the first request, removal and parse-only runs never pay for it
+        if self._backend is None:
+            with self._backend_lock:
+                if self._backend is None:
+                    self._backend = create_backend(self._backend_spec, self._base_url)
+        return self._backend
 
-    def _get_ai_response(self, messages: List[Prompt]):
-        response = self._client.chat.completions.create(
-            messages=messages,
-            model=self._model,
-        )
-        return response
+    @backend.setter
+    def backend(self, backend: Backend | None) -> None:
+        self._backend = backend
+
+    def configure_backend(self, spec: str, base_url: str | None = None) -> None:
+        with self._backend_lock:
+            self._backend_spec = spec
+            self._base_url = base_url
+            self._backend = None
+            self._route_backends = {}
+        # sessions of the replaced backends are closed with the client
+
+    def route_for(self, obj_type: str, lines: int, height: int) -> str | None:
+        if self.router is None:
+            return None
+        return self.router.route(obj_type, lines, height)
+
+    def _route(self, name: str | None) -> Route | None:
+        if name is None:
+            return None
+        if self.router is None or name not in self.router.routes:
+            raise ValueError(f"Unknown route {name}")
+        return self.router.routes[name]
+
+    def _backend_for(self, route: Route | None) -> Backend:
+        if route is None or (route.backend, route.base_url) == (
+            self._backend_spec,
+            self._base_url,
+        ):
+            return self.backend
+        key = (route.backend, route.base_url)
+        with self._backend_lock:
+            if key not in self._route_backends:
+                self._route_backends[key] = create_backend(*key)
+            return self._route_backends[key]
+
+    # a batched request answers several blocks, so it may use as many tokens
+    def _request_options(self, route: Route | None, items: int = 1) -> Tuple[str, Dict]:
+        if route is None:
+            return self._model, {}
+        if route.max_tokens is None:
+            return route.model, {}
+        return route.model, {"max_tokens": route.max_tokens * items}
+
+    def _record_request(
+        self, start: float, completion: Completion | None, model: str
+    ) -> None:
+        if self.metrics is not None:
+            self.metrics.record_request(time.perf_counter() - start, completion, model)
+
+    def _retry_delay(self, error: BackendError, attempt: int) -> float | None:
+        delay = self.scheduler.on_failure(error, attempt)
+        if delay is not None and self.metrics is not None:
+            self.metrics.record_retry()
+        return delay
+
+    def _get_ai_response(
+        self, messages: List[Prompt], route: Route | None = None, **kwargs
+    ) -> Completion:
+        backend = self._backend_for(route)
+        model, options = self._request_options(route)
+        estimated = sum(estimate_tokens(message["content"]) for message in messages)
+        attempt = 0
+        while True:
+            time.sleep(self.scheduler.acquire(estimated))
+            start = time.perf_counter()
+            try:
+                completion = backend.complete(model, messages, **options, **kwargs)
+            except BackendError as e:
+                self._record_request(start, None, model)
+                if (delay := self._retry_delay(e, attempt)) is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self._record_request(start, completion, model)
+            self.scheduler.on_success(estimated, completion)
+            return completion
+
+    async def _get_ai_response_async(
+        self, session: AsyncSession, messages: List[Prompt], model: str, **kwargs
+    ) -> Completion:
+        import asyncio
+
+        estimated = sum(estimate_tokens(message["content"]) for message in messages)
+        attempt = 0
+        while True:
+            await asyncio.sleep(self.scheduler.acquire(estimated))
+            start = time.perf_counter()
+            try:
+                completion = await session.complete(model, messages, **kwargs)
+            except BackendError as e:
+                self._record_request(start, None, model)
+                if (delay := self._retry_delay(e, attempt)) is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self._record_request(start, completion, model)
+            self.scheduler.on_success(estimated, completion)
+            return completion
 
     def update_history(self, message: str, role="user") -> None:
-        self._messages.append({"role": role, "content": message})
+        with self._messages_lock:
+            self._messages.append({"role": role, "content": message})
+
+    def _cache_key(self, message: str, model: str) -> str:
+        return ResponseCache.make_key(model, self._prompt["content"], message)
+
+    def _get_cached(self, message: str, model: str) -> str | None:
+        if self.cache is None:
+            return None
+        return self.cache.get(self._cache_key(message, model))
 
-    def single_response(self, message: str) -> str:
+    def _set_cached(self, message: str, content: str, model: str) -> None:
+        if self.cache is not None:
+            self.cache.set(self._cache_key(message, model), content)
+
+    def single_response(self, message: str, route: str | None = None) -> str:
+        target = self._route(route)
+        model, _ = self._request_options(target)
+        if (cached := self._get_cached(message, model)) is not None:
+            return cached
         response = self._get_ai_response(
             messages=[self._prompt, {"role": "user", "content": message}],
+            route=target,
         )
-        return response.choices[0].message.content.strip()
+        content = response.content.strip()
+        self._set_cached(message, content, model)
+        return content
+
+    def _event_loop(self):
+        # imported on demand, removal and parse-only runs never need an event loop
+        import asyncio
+
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = Thread(
+                    target=self._loop.run_forever, name="auto-doc-requests", daemon=True
+                )
+                self._loop_thread.start()
+            return self._loop
+
+    def _run(self, coroutine: Coroutine[Any, Any, Any]) -> Any:
+        import asyncio
+
+        future = asyncio.run_coroutine_threadsafe(coroutine, self._event_loop())
+        try:
+            return future.result()
+        except BaseException:
+            # e.g. Ctrl+C in the waiting thread, the requests are dropped too
+            future.cancel()
+            raise
+
+    # only ever called on the event loop, which owns the sessions
+    def _session(self, backend: Backend) -> AsyncSession:
+        if backend not in self._sessions:
+            self._sessions[backend] = backend.open_session()
+        return self._sessions[backend]
+
+    async def _close_sessions(self) -> None:
+        sessions, self._sessions = self._sessions, {}
+        self._route_limits = {}
+        for session in sessions.values():
+            await session.close()
+
+    def close(self) -> None:
+        with self._loop_lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        import asyncio
+
+        asyncio.run_coroutine_threadsafe(self._close_sessions(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        self._loop_thread.join()  # type: ignore
+        loop.close()
+
+    # Every route gets its own concurrency limit, and is only batched with
+    # blocks sent to the same route. Routes without a limit of their own take
+    # the -C limit per call. `results` holds the cached answers.
+    async def _gather_responses(
+        self,
+        messages: List[str],
+        routes: List[str | None],
+        results: List[str | None],
+        max_concurrency: int,
+        batch_token_budget: int,
+        max_batch_items: int,
+    ) -> List[str]:
+        import asyncio
+
+        targets = {name: self._route(name) for name in dict.fromkeys(routes)}
+        models = {
+            name: self._request_options(route)[0] for name, route in targets.items()
+        }
+        semaphores = {}
+        for name, route in targets.items():
+            if route is None or not route.max_concurrency:
+                semaphores[name] = asyncio.Semaphore(max_concurrency)
+                continue
+            key = (route.name, route.max_concurrency)
+            if key not in self._route_limits:
+                self._route_limits[key] = asyncio.Semaphore(route.max_concurrency)
+            semaphores[name] = self._route_limits[key]
+        sessions = {
+            name: self._session(self._backend_for(route))
+            for name, route in targets.items()
+        }
+
+        async def request(
+            name: str | None, message: str, items: int = 1, **kwargs
+        ) -> str:
+            model, options = self._request_options(targets[name], items)
+            async with semaphores[name]:
+                response = await self._get_ai_response_async(
+                    sessions[name],
+                    messages=[self._prompt, {"role": "user", "content": message}],
+                    model=model,
+                    **options,
+                    **kwargs,
+                )
+            return response.content.strip()
+
+        async def respond(index: int) -> None:
+            name = routes[index]
+            content = await request(name, messages[index])
+            self._set_cached(messages[index], content, models[name])
+            results[index] = content
+
+        async def respond_batch(name: str | None, batch: List[Tuple[str, str]]) -> None:
+            try:
+                content = await request(
+                    name,
+                    build_batch_message(batch),
+                    len(batch),
+                    response_format={"type": "json_object"},
+                )
+            except BackendError as e:
+                if not e.is_rejected:
+                    raise
+                # e.g. an OpenAI compatible server without JSON mode
+                self._unbatched_routes.add(name)
+                await asyncio.gather(
+                    *(respond(int(message_id)) for message_id, _ in batch)
+                )
+                return
+            answers = parse_batch_response(
+                content, [message_id for message_id, _ in batch]
+            )
+            missing = []
+            for message_id, message in batch:
+                if message_id not in answers:
+                    missing.append(int(message_id))
+                    continue
+                self._set_cached(message, answers[message_id], models[name])
+                results[int(message_id)] = answers[message_id]
+            # malformed or incomplete batch answers are retried one by one
+            await asyncio.gather(*(respond(index) for index in missing))
+
+        batches: List[Tuple[str | None, List[Tuple[str, str]]]] = []
+        for name in targets:
+            pending = [
+                (str(index), message)
+                for index, message in enumerate(messages)
+                if routes[index] == name and results[index] is None
+            ]
+            if batch_token_budget > 0 and name not in self._unbatched_routes:
+                packed = pack_batches(pending, batch_token_budget, max_batch_items)
+            else:
+                packed = [[item] for item in pending]
+            batches.extend((name, batch) for batch in packed)
+
+        await asyncio.gather(
+            *(
+                (
+                    respond(int(batch[0][0]))
+                    if len(batch) == 1
+                    else respond_batch(name, batch)
+                )
+                for name, batch in batches
+            )
+        )
+        return results  # type: ignore
+
+    def concurrent_responses(
+        self,
+        messages: List[str],
+        max_concurrency: int,
+        batch_token_budget: int = 0,
+        max_batch_items: int = 8,
+        routes: List[str | None] | None = None,
+    ) -> List[str]:
+        if not messages:
+            return []
+        routes = routes or [None] * len(messages)
+        # looked up here, the event loop is shared and never waits on the cache
+        results = [
+            self._get_cached(message, self._request_options(self._route(name))[0])
+            for message, name in zip(messages, routes)
+        ]
+        if all(result is not None for result in results):
+            return results  # type: ignore
+        return self._run(
+            self._gather_responses(
+                messages,
+                routes,
+                results,
+                max_concurrency,
+                batch_token_budget,
+                max_batch_items,
+            )
+        )
+
+    # Submits (id, message) pairs to the backend's batch endpoint, answered
+    # within hours at a lower price instead of right away.
+    def submit_batch(
+        self, messages: List[Tuple[str, str]], route: str | None = None
+    ) -> str:
+        target = self._route(route)
+        model, options = self._request_options(target)
+        return self._backend_for(target).submit_batch(
+            model,
+            [
+                (message_id, [self._prompt, {"role": "user", "content": message}])
+                for message_id, message in messages
+            ],
+            **options,
+        )
+
+    def batch_results(
+        self, batch_id: str, route: str | None = None
+    ) -> Dict[str, str] | None:
+        results = self._backend_for(self._route(route)).batch_results(batch_id)
+        if results is None:
+            return None
+        return {message_id: content.strip() for message_id, content in results.items()}
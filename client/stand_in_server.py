@@ -0,0 +1,284 @@
+# Run from the repository root as `python -m client.stand_in_server`
+import argparse
+import email.parser
+import email.policy
+import itertools
+import json
+import os
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock
+from typing import Dict
+
+from client.fake import FakeResponder, LatencyModel
+
+
+# Uploaded files and batches for the batch endpoint. Batches are answered when
+# created and report in_progress until `delay` seconds have passed.
+class BatchStore:
+    def __init__(self, responder: FakeResponder, delay: float = 0.0) -> None:
+        self.responder = responder
+        self.delay = delay
+        self.files: Dict[str, bytes] = {}
+        self.batches: Dict[str, Dict] = {}
+        self._ids = itertools.count()
+        self._lock = Lock()
+
+    def add_file(self, content: bytes, filename: str, purpose: str) -> Dict:
+        with self._lock:
+            file_id = f"file-stand-in-{next(self._ids)}"
+            self.files[file_id] = content
+        return {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+        }
+
+    def create_batch(self, input_file_id: str) -> Dict | None:
+        if input_file_id not in self.files:
+            return None
+        output = []
+        for line in self.files[input_file_id].decode("utf8").splitlines():
+            request = json.loads(line)
+            completion = self.responder.respond(request["body"]["messages"])
+            body = {
+                "object": "chat.completion",
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": completion.content},
+                        "finish_reason": "stop",
+                    }
+                ],
+            }
+            output.append(
+                json.dumps(
+                    {
+                        "custom_id": request["custom_id"],
+                        "response": {"status_code": 200, "body": body},
+                    }
+                )
+            )
+        output_file = self.add_file(
+            "".join(line + "\n" for line in output).encode("utf8"),
+            "batch_output.jsonl",
+            "batch_output",
+        )
+        with self._lock:
+            batch_id = f"batch-stand-in-{os.urandom(6).hex()}"
+            self.batches[batch_id] = {
+                "id": batch_id,
+                "object": "batch",
+                "input_file_id": input_file_id,
+                "output_file_id": output_file["id"],
+                "created_at": time.time(),
+            }
+        return self.get_batch(batch_id)
+
+    def get_batch(self, batch_id: str) -> Dict | None:
+        batch = self.batches.get(batch_id)
+        if batch is None:
+            return None
+        done = time.time() - batch["created_at"] >= self.delay
+        return {
+            **batch,
+            "status": "completed" if done else "in_progress",
+            "output_file_id": batch["output_file_id"] if done else None,
+        }
+
+
+def parse_multipart(content_type: str, body: bytes) -> Dict[str, bytes]:
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body
+    )
+    return {
+        part.get_param("name", header="content-disposition"): part.get_payload(
+            decode=True
+        )
+        for part in message.iter_parts()  # type: ignore
+    }
+
+
+def make_handler(
+    responder: FakeResponder, batches: BatchStore | None = None
+) -> type[BaseHTTPRequestHandler]:
+    store = batches or BatchStore(responder)
+
+    class ChatCompletionsHandler(BaseHTTPRequestHandler):
+        # keep-alive, so clients reuse connections like they do against the API
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(
+            self, status: int, body: Dict, headers: Dict[str, str] | None = None
+        ) -> None:
+            payload = json.dumps(body).encode("utf8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _not_found(self) -> None:
+            self._send_json(404, {"error": {"message": "Not found"}})
+
+        def do_GET(self) -> None:
+            parts = self.path.strip("/").split("/")
+            if parts[-2:-1] == ["batches"]:
+                batch = store.get_batch(parts[-1])
+                if batch is None:
+                    self._not_found()
+                    return
+                self._send_json(200, batch)
+            elif parts[-3:-2] == ["files"] and parts[-1] == "content":
+                content = store.files.get(parts[-2])
+                if content is None:
+                    self._not_found()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+            else:
+                self._not_found()
+
+        def _upload_file(self, body: bytes) -> None:
+            fields = parse_multipart(self.headers.get("Content-Type", ""), body)
+            if "file" not in fields:
+                self._send_json(400, {"error": {"message": "Missing file"}})
+                return
+            purpose = fields.get("purpose", b"batch").decode("utf8")
+            self._send_json(
+                200, store.add_file(fields["file"], "upload.jsonl", purpose)
+            )
+
+        def do_POST(self) -> None:
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length)
+            if self.path.endswith("/files"):
+                self._upload_file(body)
+                return
+            request = json.loads(body or b"{}")
+            if self.path.endswith("/batches"):
+                batch = store.create_batch(request.get("input_file_id", ""))
+                if batch is None:
+                    self._not_found()
+                    return
+                self._send_json(200, batch)
+                return
+            if not self.path.endswith("/chat/completions"):
+                self._not_found()
+                return
+
+            delay, error = responder.plan()
+            time.sleep(delay)
+            if error is not None:
+                headers = {}
+                if error.retry_after is not None:
+                    headers["Retry-After"] = str(error.retry_after)
+                self._send_json(
+                    error.status_code or 500,
+                    {"error": {"message": str(error), "type": "stand_in_error"}},
+                    headers,
+                )
+                return
+
+            completion = responder.respond(
+                request.get("messages", []),
+                response_format=request.get("response_format"),
+            )
+            self._send_json(
+                200,
+                {
+                    "id": "chatcmpl-stand-in",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model", "stand-in"),
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {
+                                "role": "assistant",
+                                "content": completion.content,
+                            },
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": completion.prompt_tokens,
+                        "completion_tokens": completion.completion_tokens,
+                        "total_tokens": completion.prompt_tokens
+                        + completion.completion_tokens,
+                    },
+                },
+            )
+
+        def log_message(self, format: str, *args) -> None:
+            pass
+
+    return ChatCompletionsHandler
+
+
+def create_server(
+    responder: FakeResponder,
+    host: str = "127.0.0.1",
+    port: int = 0,
+    batch_delay: float = 0.0,
+) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(
+        (host, port), make_handler(responder, BatchStore(responder, batch_delay))
+    )
+    server.daemon_threads = True
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m client.stand_in_server",
+        description="OpenAI compatible stand-in server with deterministic docs.",
+    )
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8808)
+    parser.add_argument(
+        "--latency",
+        type=str,
+        default="fixed:0",
+        help="fixed:S, uniform:LOW:HIGH, exponential:MEAN or lognormal:MEDIAN:SIGMA",
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--batch-delay",
+        type=float,
+        default=0.0,
+        help="Seconds a batch reports in_progress before its results are ready",
+    )
+    args = parser.parse_args()
+
+    responder = FakeResponder(
+        latency=LatencyModel.parse(args.latency),
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    server = create_server(responder, args.host, args.port, args.batch_delay)
+    print(f"Serving stand-in completions on http://{args.host}:{server.server_port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,119 @@
 import os
-import traceback
-from concurrent.futures import ThreadPoolExecutor
-from threading import Lock
-from typing import Type
+import sys
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from threading import BoundedSemaphore, Lock
+from typing import Dict, Iterable, Iterator, List, Tuple, Type
 
+from client.cache import ResponseCache
+from client.backends import BackendError
+from client.routing import Router
+from client.scheduler import RequestScheduler
 from core import settings
-from parsers.base_parser import Parser
-from parsers.py_parser import PythonParser
-
-shared_resource_lock = Lock()
+from core.console import print_exc, safe_print
+from core.embeder import DocstringManager, strip_file
+from core.jobs import JobFile, JobRecord
+from core.manifest import Manifest
+from core.metrics import Metrics
+from core.parse_cache import ParseCache
+from core.walker import SourceWalker
+from models import blocks
+from models.blocks import CodeBlock
+from models.descriptors import FileDescriptor
+from parsers.base_parser import (
+    Parser,
+    detect_newline,
+    hash_source,
+    split_lines,
+    write_atomic,
+)
+from parsers.py_parser import PythonParser, describe_file
 
 
 class App:
     def __init__(self, **kwargs) -> None:
-        self.target_dir_name = kwargs.get("target_dir_name")
+        self.target_dir_name: str | None = kwargs.get("target_dir_name")
         self.num_workers = kwargs.get("num_workers", settings.WORKER_COUNT)
+        self.max_pending_files = kwargs.get(
+            "max_pending_files", settings.MAX_PENDING_FILES
+        )
+        self._pending_slots = BoundedSemaphore(self.max_pending_files)
+        self.include = kwargs.get("include")
+        self.exclude = kwargs.get("exclude")
+        # an explicit 0 parses in the worker threads
+        parse_workers = kwargs.get("parse_workers")
+        self.parse_workers: int = (
+            settings.PARSE_WORKERS if parse_workers is None else parse_workers
+        )
         self.target_file_name = kwargs.get("target_file_name")
         self.replace_docs = kwargs.get("replace_docs")
         self.remove_docs = kwargs.get("remove_docs")
+        self.max_concurrent_requests = kwargs.get(
+            "max_concurrent_requests", settings.MAX_CONCURRENT_REQUESTS
+        )
+        self.batch_token_budget = kwargs.get(
+            "batch_token_budget", settings.BATCH_TOKEN_BUDGET
+        )
+        self.prompt_token_budget = kwargs.get(
+            "prompt_token_budget", settings.PROMPT_TOKEN_BUDGET
+        )
+        self.backend = kwargs.get("backend") or "openai"
+        self.routes_path = kwargs.get("routes_path")
+        self.base_url = kwargs.get("base_url")
+        self.requests_per_minute = kwargs.get(
+            "requests_per_minute", settings.REQUESTS_PER_MINUTE
+        )
+        self.tokens_per_minute = kwargs.get(
+            "tokens_per_minute", settings.TOKENS_PER_MINUTE
+        )
+        self.max_retries = kwargs.get("max_retries", settings.MAX_RETRIES)
+        self.no_cache = kwargs.get("no_cache")
+        self.cache_dir = kwargs.get("cache_dir") or settings.CACHE_DIR
+        self.dry_run = kwargs.get("dry_run")
+        self.incremental = kwargs.get("incremental")
+        self.full_rebuild = kwargs.get("full_rebuild")
+        self.manifest: Manifest | None = None
+        self.serve = kwargs.get("serve")
+        self.socket_path = kwargs.get("socket_path")
+        self.port = kwargs.get("port")
+        self.since = kwargs.get("since")
+        self.staged = kwargs.get("staged")
+        # changed line ranges per real path in --since/--staged mode
+        self._changes: Dict[str, List[Tuple[int, int]]] | None = None
+        self.watch = kwargs.get("watch")
+        self.watch_debounce = kwargs.get("watch_debounce", settings.WATCH_DEBOUNCE)
+        self.watch_poll = kwargs.get("watch_poll")
+        # block fingerprints per file while watching, None otherwise
+        self._fingerprints: Dict[str, Dict[str, str]] | None = None
+        self.plan_path = kwargs.get("plan_path")
+        self.execute_path = kwargs.get("execute_path")
+        self.apply_path = kwargs.get("apply_path")
+        self.batch = kwargs.get("batch")
+        self.metrics_path = kwargs.get("metrics_path")
+        self.prometheus_path = kwargs.get("prometheus_path")
+        self.metrics = Metrics(settings.METRICS_SLOWEST_FILES)
+        self.profiler = None
+        if kwargs.get("profile_dir"):
+            # cProfile and tracemalloc are only loaded when profiling
+            from core.profiler import FileProfiler
+
+            self.profiler = FileProfiler(
+                kwargs["profile_dir"],
+                sample_rate=kwargs.get("profile_sample", 1.0),
+                top_files=settings.PROFILE_TOP_FILES,
+                trace_memory=bool(kwargs.get("profile_memory")),
+                allocation_lines=settings.PROFILE_ALLOCATION_LINES,
+            )
+        self._file_locks: Dict[str, Lock] = {}
+        self._file_locks_guard = Lock()
+
+    def _get_file_lock(self, file_path: str) -> Lock:
+        key = os.path.realpath(file_path)
+        with self._file_locks_guard:
+            if key not in self._file_locks:
+                self._file_locks[key] = Lock()
+            return self._file_locks[key]
 
     def _get_language_type(self, file_name: str) -> str | None:
         _, extension = os.path.splitext(file_name)
@@ -25,7 +121,7 @@ class App:
         if extension in [".py"]:
             language = "python"
         else:
-            print("Unsupported file type")
+            safe_print("Unsupported file type")
         return language
 
     def _get_parser_for_language(self, language: str) -> Type[Parser]:
@@ -34,41 +130,696 @@ class App:
             raise ValueError("Unsupported language")
         return parsers[language]
 
-    def process_file(self, file_path: str) -> None:
+    def process_file(
+        self, file_path: str, descriptor: FileDescriptor | None = None
+    ) -> None:
+        if self.profiler is None:
+            self._process_file(file_path, descriptor)
+            return
+        with self.profiler.profile(file_path):
+            self._process_file(file_path, descriptor)
+
+    def _process_file(
+        self, file_path: str, descriptor: FileDescriptor | None = None
+    ) -> None:
+        start = time.perf_counter()
+        failed = skipped = False
         try:
-            print(f"Processing file: {file_path}")
+            if (
+                descriptor is None
+                and self.manifest is not None
+                and self.manifest.is_unchanged(file_path)
+            ):
+                skipped = True
+                return
+            safe_print(f"Processing file: {file_path}")
             language = self._get_language_type(file_path)
 
             if language is None:
                 raise ValueError("Unsupported Language")
 
-            f_parser = self._get_parser_for_language(language)(file_path)  # type: ignore
+            if self.remove_docs and not self.dry_run and self._changes is None:
+                self._strip_file(file_path)
+                return
 
-            with shared_resource_lock:
-                f_parser.parse_file()
+            f_parser = self._new_parser(file_path, language)
+
+            # each file runs independently, only work on the same path is serialized
+            with self._get_file_lock(file_path):
+                if descriptor is None or not f_parser.load_descriptor(descriptor):
+                    with self.metrics.phase(file_path, "parse"):
+                        f_parser.parse_file()
+                touched = self._touched_blocks(file_path, f_parser)
                 if self.replace_docs or self.remove_docs:
-                    f_parser.remove_doc_strings()
+                    with self.metrics.phase(file_path, "remove"):
+                        f_parser.remove_doc_strings(
+                            keep_bodies=bool(self.remove_docs),
+                            code_blocks=(
+                                touched
+                                if touched is not None
+                                else self._edited_blocks(file_path, f_parser)
+                            ),
+                        )
+                if self.dry_run:
+                    self._report_dry_run(f_parser, touched)
+                    return
                 if not self.remove_docs:
-                    f_parser.embed_documentation()
-                f_parser.write_to_file()
+                    with self.metrics.phase(file_path, "embed"):
+                        f_parser.embed_documentation(touched)
+                with self.metrics.phase(file_path, "write"):
+                    f_parser.write_to_file()
+                if self.manifest is not None:
+                    self.manifest.record(file_path, f_parser.source_hash)
+
+        except (ValueError, SyntaxError, OSError, BackendError) as e:
+            failed = True
+            safe_print(f"Error processing file {file_path}: {e}")
+            print_exc()
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            # every exit counts, early ones included
+            self.metrics.record_file(
+                file_path, time.perf_counter() - start, failed, skipped
+            )
 
-        except ValueError as e:
-            print(f"Error processing file {file_path}: {e}")
-            traceback.print_exc()
+    def _new_parser(self, file_path: str, language: str) -> Parser:
+        return self._get_parser_for_language(language)(
+            file_path,
+            max_concurrent_requests=self.max_concurrent_requests,
+            batch_token_budget=self.batch_token_budget,
+            prompt_token_budget=self.prompt_token_budget,
+        )  # type: ignore
+
+    # Documents an editor buffer for the daemon and returns the new text, the
+    # file on disk is neither read nor written. Blocks already parsed from the
+    # same content are taken from the parse cache.
+    def document_buffer(
+        self, file_path: str, source: str, parse_cache: ParseCache | None = None
+    ) -> str:
+        language = self._get_language_type(file_path)
+        if language is None:
+            raise ValueError("Unsupported Language")
+        f_parser = self._new_parser(file_path, language)
+        source_hash = hash_source(source)
+        block_table = None
+        if parse_cache is not None:
+            block_table = parse_cache.get(file_path, source_hash)
+        if block_table is None:
+            f_parser.parse_source(source)
+            if parse_cache is not None:
+                parse_cache.set(file_path, source_hash, f_parser.block_table)
+        else:
+            f_parser.load_source(source, block_table, source_hash)
+        if self.replace_docs or self.remove_docs:
+            f_parser.remove_doc_strings(keep_bodies=bool(self.remove_docs))
+        if not self.remove_docs:
+            f_parser.embed_documentation()
+        f_parser.apply_edits()
+        text = "".join(f_parser.lines)
+        f_parser.validate(text)
+        return text
+
+    # the daemon's in-place variant, errors reach the caller instead of the log
+    def document_file(
+        self, file_path: str, parse_cache: ParseCache | None = None
+    ) -> Tuple[str, str]:
+        with self._get_file_lock(file_path):
+            with open(file_path, "r", encoding="utf8") as file:
+                source = file.read()
+                newline = detect_newline(file.newlines)
+            text = self.document_buffer(file_path, source, parse_cache)
+            if text != source:
+                write_atomic(file_path, split_lines(text), newline)
+        return source, text
+
+    # in --since/--staged mode only the blocks a changed line falls in
+    def _touched_blocks(
+        self, file_path: str, f_parser: Parser
+    ) -> List[CodeBlock] | None:
+        if self._changes is None:
+            return None
+        line_ranges = self._changes.get(os.path.realpath(file_path), [])
+        return f_parser.blocks_touching(line_ranges)
+
+    # While watching, --r only replaces the docstrings of blocks whose code
+    # changed since the file was last seen. Nothing is known about a file the
+    # first time it is saved, so that save only fills in missing docstrings.
+    def _edited_blocks(
+        self, file_path: str, f_parser: Parser
+    ) -> List[CodeBlock] | None:
+        if self._fingerprints is None:
+            return None
+        fingerprints = f_parser.block_fingerprints()
+        previous = self._fingerprints.get(file_path)
+        self._fingerprints[file_path] = {
+            key: fingerprint for key, (fingerprint, _) in fingerprints.items()
+        }
+        if previous is None:
+            return []
+        return [
+            code_block
+            for key, (fingerprint, code_block) in fingerprints.items()
+            if previous.get(key) != fingerprint
+        ]
+
+    # -R never talks to the model, the docstrings are cut out in one pass
+    def _strip_file(self, file_path: str) -> None:
+        manager = DocstringManager(file_path)
+        with self._get_file_lock(file_path):
+            with self.metrics.phase(file_path, "remove"):
+                manager.remove_doc_strings()
+        if self.manifest is not None:
+            self.manifest.record(file_path, manager.source_hash)
+
+    def _report_dry_run(
+        self, f_parser: Parser, code_blocks: List[CodeBlock] | None = None
+    ) -> None:
+        pending = 0
+        if not self.remove_docs:
+            pending = sum(
+                code_block.doc_string is None
+                for code_block in (
+                    f_parser.code_blocks if code_blocks is None else code_blocks
+                )
+            )
+        safe_print(
+            f"Dry run {f_parser.file_name}: {pending} docstrings to add, "
+            f"{len(f_parser.edits)} to remove"
+        )
+
+    def _take_slot(self) -> None:
+        # blocks the walk while MAX_PENDING_FILES files are still in flight
+        self._pending_slots.acquire()
+        self.metrics.queue_put()
+
+    def _release_slot(self) -> None:
+        self.metrics.queue_take()
+        self._pending_slots.release()
+
+    def _process_queued_file(
+        self, file_path: str, descriptor: FileDescriptor | None = None
+    ) -> None:
+        try:
+            self.process_file(file_path, descriptor)
+        finally:
+            self._release_slot()
+
+    def _open_manifest(
+        self, root: str | None = None, rebuild: bool = False
+    ) -> Manifest:
+        signature = f"replace={bool(self.replace_docs)};remove={bool(self.remove_docs)}"
+        root = root or self.target_dir_name
+        if root is None:
+            raise ValueError("invalid targets")
+        return Manifest(
+            root,
+            signature,
+            rebuild=rebuild or bool(self.full_rebuild),
+        )
+
+    def _iter_source_files(self) -> Iterator[str]:
+        if self.target_dir_name is None:
+            raise ValueError("invalid targets")
+        return iter(
+            SourceWalker(
+                self.target_dir_name,
+                ignored_dirs=settings.IGNORED_DIRS_SET,
+                include=self.include or (),
+                exclude=self.exclude or (),
+            )
+        )
+
+    # unchanged files are recorded as skipped, ones gone since the walk as
+    # failed, neither is submitted
+    def _skip_unchanged(self, file_path: str) -> bool:
+        if self.manifest is None:
+            return False
+        try:
+            unchanged = self.manifest.is_unchanged(file_path)
+        except OSError as e:
+            safe_print(f"Error processing file {file_path}: {e}")
+            self.metrics.record_file(file_path, 0.0, failed=True)
+            return True
+        if unchanged:
+            self.metrics.record_file(file_path, 0.0, skipped=True)
+        return unchanged
+
+    def _on_parsed(
+        self, executor: ThreadPoolExecutor, file_path: str, future: Future
+    ) -> None:
+        # the slot travels with the file to the thread pool, and is released
+        # here on every other path, a lost slot would stall the walk for good
+        handed_over = False
+        try:
+            descriptor: FileDescriptor = future.result()
+            self.metrics.record_phase(file_path, "parse", descriptor.parse_seconds)
+            if descriptor.needs_work(bool(self.replace_docs), bool(self.remove_docs)):
+                executor.submit(self._process_queued_file, file_path, descriptor)
+                handed_over = True
+                return
+            self.metrics.record_file(file_path, descriptor.parse_seconds, skipped=True)
+            if self.manifest is not None:
+                self.manifest.record(file_path, descriptor.sha256)
+        # e.g. the RecursionError ast.parse raises on deeply nested expressions
+        except Exception as e:
+            safe_print(f"Error processing file {file_path}: {e}")
+            self.metrics.record_file(file_path, 0.0, failed=True)
+        finally:
+            if not handed_over:
+                self._release_slot()
+
+    # CPU bound parsing runs on every core, only files with blocks to change
+    # reach the thread pool that talks to the model and writes. Each parsed
+    # file is handed over as soon as it is ready.
+    def _run_pipeline(self, executor: ThreadPoolExecutor) -> None:
+        # multiprocessing is only worth importing for directory runs
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=self.parse_workers) as parse_pool:
+            for file_path in self._iter_source_files():
+                if self._skip_unchanged(file_path):
+                    continue
+                self._take_slot()
+                future = parse_pool.submit(describe_file, file_path)
+                future.add_done_callback(partial(self._on_parsed, executor, file_path))
+
+    def _on_stripped(self, file_path: str, future: Future) -> None:
+        try:
+            source_hash, _, seconds = future.result()
+        except Exception as e:
+            safe_print(f"Error processing file {file_path}: {e}")
+            self.metrics.record_file(file_path, 0.0, failed=True)
+        else:
+            self.metrics.record_phase(file_path, "remove", seconds)
+            self.metrics.record_file(file_path, seconds, failed=False)
+            if self.manifest is not None:
+                self.manifest.record(file_path, source_hash)
+        finally:
+            self._release_slot()
+
+    # stripping is pure CPU work, so -R over a tree runs entirely in the
+    # process pool and never reaches the thread pool
+    def _run_strip_pipeline(self) -> None:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=self.parse_workers) as strip_pool:
+            for file_path in self._iter_source_files():
+                if self._skip_unchanged(file_path):
+                    continue
+                self._take_slot()
+                safe_print(f"Processing file: {file_path}")
+                future = strip_pool.submit(strip_file, file_path)
+                future.add_done_callback(partial(self._on_stripped, file_path))
 
     def process_directory(self) -> None:
-        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
-            for root, dirs, files in os.walk(self.target_dir_name, topdown=True):
-                dirs[:] = [d for d in dirs if d not in settings.IGNORED_DIRS_SET]
-                for file in files:
-                    if file.endswith(".py"):
-                        file_path = os.path.join(root, file)
-                        executor.submit(self.process_file, file_path)
+        if self.incremental:
+            self.manifest = self._open_manifest()
+        self._pending_slots = BoundedSemaphore(self.max_pending_files)
+        try:
+            if self.remove_docs and not self.dry_run and self.parse_workers > 0:
+                self._run_strip_pipeline()
+                return
+            with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+                if self.parse_workers > 0:
+                    self._run_pipeline(executor)
+                else:
+                    for file_path in self._iter_source_files():
+                        self._take_slot()
+                        executor.submit(self._process_queued_file, file_path)
+        finally:
+            if self.manifest is not None:
+                self.manifest.save()
+                safe_print(f"Skipped {self.manifest.skipped} unchanged files")
+
+    # Stays up with the client, cache and manifest warm and documents files as
+    # they are saved. Writes are recorded in the manifest, so the events they
+    # raise find the file unchanged and do not loop back.
+    def watch_files(self) -> None:
+        # inotify bindings are only needed by this mode
+        from core.watcher import FileWatcher
 
-    def run(self):
         if self.target_dir_name is not None:
-            self.process_directory()
-        elif self.target_file_name is not None:
-            self.process_file(self.target_file_name)
+            root, target = self.target_dir_name, None
         else:
-            raise ValueError("invalid targets")
+            target = os.path.abspath(self.target_file_name)  # type: ignore
+            root = os.path.dirname(target)
+        # without --incremental the manifest lives only as long as the watch
+        self.manifest = self._open_manifest(root, rebuild=not self.incremental)
+        self._fingerprints = {}
+        watcher = FileWatcher(
+            SourceWalker(
+                root,
+                ignored_dirs=settings.IGNORED_DIRS_SET,
+                include=self.include or (),
+                exclude=self.exclude or (),
+            ),
+            self.watch_debounce,
+            settings.WATCH_POLL_INTERVAL,
+            polling=bool(self.watch_poll),
+        )
+        safe_print(f"Watching {root} for changes ({watcher.kind}), Ctrl+C to stop")
+        try:
+            with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+                for changed in watcher:
+                    if target is not None:
+                        changed = {path for path in changed if path == target}
+                    for _ in executor.map(self.process_file, sorted(changed)):
+                        pass
+                    if self.incremental:
+                        self.manifest.save()
+        except KeyboardInterrupt:
+            safe_print("Stopped watching")
+        finally:
+            watcher.close()
+
+    # Documents the blocks touched by the staged changes or by everything
+    # changed since a revision. Only the files in the diff are opened.
+    def process_changes(self) -> None:
+        paths = self._changed_paths()
+        safe_print(f"{len(paths)} changed files")
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            for _ in executor.map(self.process_file, paths):
+                pass
+
+    def _changed_paths(self) -> List[str]:
+        # git is only needed in --since/--staged mode
+        from core.git_diff import changed_lines, unstaged_paths
+
+        target: str = self.target_dir_name or self.target_file_name  # type: ignore
+        self._changes = changed_lines(target, self.since, bool(self.staged))
+        root = self.target_dir_name or os.path.dirname(os.path.abspath(target))
+        walker = SourceWalker(
+            root,
+            ignored_dirs=settings.IGNORED_DIRS_SET,
+            include=self.include or (),
+            exclude=self.exclude or (),
+        )
+        paths = [
+            path
+            for path, line_ranges in self._changes.items()
+            if line_ranges and os.path.isfile(path) and walker.matches(path)
+        ]
+        if not self.staged:
+            return paths
+        # the hunks come from the index, but the file on disk is what gets
+        # parsed and written, so they only line up when the two are the same
+        unstaged = unstaged_paths(target)
+        for path in paths:
+            if path in unstaged:
+                safe_print(f"Skipping {path}: it has unstaged changes")
+        return [path for path in paths if path not in unstaged]
+
+    # Writes the prompt of every block missing a docstring to a job file
+    # instead of documenting, with the hashes it was planned against. Nothing
+    # is written to the sources until --apply.
+    def plan_jobs(self) -> None:
+        if self.remove_docs:
+            raise ValueError("-R does not call the model, there is nothing to plan")
+        if self.since or self.staged:
+            paths: Iterable[str] = self._changed_paths()
+        elif self.target_dir_name is not None:
+            paths = self._iter_source_files()
+        else:
+            paths = [self.target_file_name]  # type: ignore
+
+        job = JobFile(self.plan_path)  # type: ignore
+        job.create({"replace": bool(self.replace_docs)})
+        for file_path in paths:
+            safe_print(f"Planning file: {file_path}")
+            try:
+                job.add_records(self._plan_file(file_path, len(job.records)))
+            except (ValueError, SyntaxError, OSError) as e:
+                safe_print(f"Error processing file {file_path}: {e}")
+        safe_print(f"Planned {len(job.records)} docstrings in {self.plan_path}")
+
+    def _plan_file(self, file_path: str, first_id: int) -> List[JobRecord]:
+        # --apply finds modules by name, the path the records are kept under
+        file_path = os.path.abspath(file_path)
+        language = self._get_language_type(file_path)
+        if language is None:
+            raise ValueError("Unsupported Language")
+        f_parser = self._new_parser(file_path, language)
+        f_parser.parse_file()
+        # hashed before --r removes anything, as --apply sees the file
+        fingerprints = f_parser.block_fingerprints()
+        touched = self._touched_blocks(file_path, f_parser)
+        if self.replace_docs:
+            f_parser.remove_doc_strings(keep_bodies=False, code_blocks=touched)
+        return [
+            JobRecord(
+                id=str(first_id + index),
+                path=file_path,
+                file_sha256=f_parser.source_hash,
+                block=key,
+                block_sha256=fingerprints[key][0],
+                prompt=prompt,
+                route=route,
+            )
+            for index, (key, prompt, route) in enumerate(
+                f_parser.plan_documentation(touched)
+            )
+        ]
+
+    # Completes the planned prompts. Live requests are checkpointed to the job
+    # file every JOB_CHECKPOINT_SIZE blocks, --batch submits the rest to the
+    # backend's batch endpoint and waits for it. Either resumes where a stopped
+    # run left off.
+    def execute_jobs(self) -> None:
+        job = JobFile(self.execute_path)  # type: ignore
+        job.load()
+        try:
+            if self.batch:
+                self._execute_batch(job)
+            else:
+                self._execute_live(job)
+        except (ValueError, BackendError) as e:
+            safe_print(f"Error executing {self.execute_path}: {e}")
+        except KeyboardInterrupt:
+            safe_print("Stopped, run --execute again to resume")
+        safe_print(
+            f"Completed {len(job.results)} of {len(job.records)} docstrings "
+            f"in {self.execute_path}"
+        )
+
+    def _execute_live(self, job: JobFile) -> None:
+        pending = job.pending()
+        for start in range(0, len(pending), settings.JOB_CHECKPOINT_SIZE):
+            chunk = pending[start : start + settings.JOB_CHECKPOINT_SIZE]
+            responses = blocks.DocString.generate_docstrings(
+                [record.prompt for record in chunk],
+                self.max_concurrent_requests,
+                self.batch_token_budget,
+                settings.BATCH_MAX_BLOCKS,
+                [record.route for record in chunk],
+            )
+            job.add_results(
+                {record.id: response for record, response in zip(chunk, responses)}
+            )
+            safe_print(f"Checkpointed {len(job.results)} of {len(job.records)}")
+
+    # one batch per route, batch endpoints take a single model per batch
+    def _submit_batches(self, job: JobFile) -> None:
+        routes: Dict[str | None, List[JobRecord]] = {}
+        for record in job.unsubmitted():
+            routes.setdefault(record.route, []).append(record)
+        for route, records in routes.items():
+            batch_id = blocks.client.submit_batch(
+                [(record.id, record.prompt) for record in records], route
+            )
+            job.start_batch(batch_id, route, [record.id for record in records])
+            safe_print(f"Submitted batch {batch_id} with {len(records)} docstrings")
+
+    def _execute_batch(self, job: JobFile) -> None:
+        resumed = set(job.open_batches)
+        if resumed:
+            safe_print(f"Resuming batches {', '.join(sorted(resumed))}")
+        else:
+            self._submit_batches(job)
+        while job.open_batches:
+            running = 0
+            for batch_id, (route, record_ids) in list(job.open_batches.items()):
+                try:
+                    results = blocks.client.batch_results(batch_id, route)
+                except BackendError as e:
+                    if e.status_code != 404 or batch_id not in resumed:
+                        raise
+                    # expired, or held by a backend that did not outlive its run
+                    safe_print(f"Batch {batch_id} is gone, submitting again")
+                    job.finish_batch(batch_id)
+                    self._submit_batches(job)
+                    continue
+                if results is None:
+                    running += 1
+                    continue
+
+                expected = set(record_ids)
+                job.add_results(
+                    {
+                        record_id: content
+                        for record_id, content in results.items()
+                        if record_id in expected
+                    }
+                )
+                job.finish_batch(batch_id)
+                # failed requests stay pending for the next --execute
+                if unanswered := len(expected - results.keys()):
+                    safe_print(
+                        f"Batch {batch_id} left {unanswered} docstrings unanswered"
+                    )
+            if running:
+                safe_print(f"{running} batches in progress")
+                time.sleep(settings.BATCH_POLL_INTERVAL)
+
+    # Writes the completed docstrings into their files. A block edited or
+    # removed since it was planned no longer matches its recorded hash and
+    # is left alone, the rest of its file is still documented.
+    def apply_jobs(self) -> None:
+        job = JobFile(self.apply_path)  # type: ignore
+        job.load()
+        files: Dict[str, List[JobRecord]] = {}
+        for record in job.records.values():
+            if record.id in job.results:
+                files.setdefault(record.path, []).append(record)
+        if missing := len(job.pending()):
+            safe_print(f"{missing} docstrings in {self.apply_path} not completed yet")
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            for _ in executor.map(
+                partial(self._apply_file, job), files.keys(), files.values()
+            ):
+                pass
+
+    def _apply_file(
+        self, job: JobFile, file_path: str, records: List[JobRecord]
+    ) -> None:
+        start = time.perf_counter()
+        failed = False
+        try:
+            language = self._get_language_type(file_path)
+            if language is None:
+                raise ValueError("Unsupported Language")
+            f_parser = self._new_parser(file_path, language)
+            with self._get_file_lock(file_path):
+                f_parser.parse_file()
+                fingerprints = f_parser.block_fingerprints()
+                answered: List[Tuple[CodeBlock, str]] = []
+                for record in records:
+                    # the block was removed or renamed since planning
+                    if record.block not in fingerprints:
+                        continue
+                    fingerprint, code_block = fingerprints[record.block]
+                    if fingerprint == record.block_sha256:
+                        answered.append((code_block, job.results[record.id]))
+                if len(answered) < len(records):
+                    safe_print(
+                        f"Skipping {len(records) - len(answered)} blocks in "
+                        f"{file_path} changed since planning"
+                    )
+                if job.options.get("replace"):
+                    f_parser.remove_doc_strings(
+                        keep_bodies=False,
+                        code_blocks=[code_block for code_block, _ in answered],
+                    )
+                for code_block, doc_string in answered:
+                    # documented by hand since planning
+                    if code_block.doc_string is None:
+                        f_parser.insert_docstring(code_block, doc_string)
+                f_parser.write_to_file()
+            safe_print(f"Documentation applied for {file_path}")
+        except (ValueError, SyntaxError, OSError) as e:
+            failed = True
+            safe_print(f"Error processing file {file_path}: {e}")
+            print_exc()
+        self.metrics.record_file(file_path, time.perf_counter() - start, failed)
+
+    def serve_requests(self) -> None:
+        from core.server import DocServer
+
+        try:
+            if self.port is not None:
+                server = DocServer(self, port=self.port)
+            else:
+                socket_path = self.socket_path or settings.SERVER_SOCKET
+                server = DocServer(self, socket_path=socket_path)
+        except OSError as e:
+            safe_print(f"Could not serve documentation requests: {e}")
+            sys.exit(1)
+        safe_print(f"Serving documentation requests on {server.address}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            safe_print("Stopped serving")
+
+    def _open_cache(self) -> ResponseCache | None:
+        if (
+            self.no_cache
+            or self.remove_docs
+            or self.dry_run
+            or self.plan_path
+            or self.apply_path
+        ):
+            return None
+        return ResponseCache(self.cache_dir, settings.CACHE_MAX_BYTES)
+
+    def run(self):
+        if self.backend != "openai" or self.base_url is not None:
+            blocks.client.configure_backend(self.backend, self.base_url)
+        if self.routes_path:
+            blocks.client.router = Router.load(self.routes_path)
+        blocks.client.scheduler = RequestScheduler(
+            requests_per_minute=self.requests_per_minute,
+            tokens_per_minute=self.tokens_per_minute,
+            max_retries=self.max_retries,
+            backoff_base=settings.BACKOFF_BASE,
+            backoff_max=settings.BACKOFF_MAX,
+            failure_threshold=settings.CIRCUIT_FAILURE_THRESHOLD,
+            cooldown=settings.CIRCUIT_COOLDOWN,
+        )
+        cache = self._open_cache()
+        blocks.client.cache = cache
+        blocks.client.metrics = self.metrics
+        if self.profiler is not None:
+            self.profiler.start()
+        try:
+            if self.plan_path:
+                self.plan_jobs()
+            elif self.execute_path:
+                self.execute_jobs()
+            elif self.apply_path:
+                self.apply_jobs()
+            elif self.serve:
+                self.serve_requests()
+            elif self.watch:
+                self.watch_files()
+            elif self.since or self.staged:
+                self.process_changes()
+            elif self.target_dir_name is not None:
+                self.process_directory()
+            elif self.target_file_name is not None:
+                self.process_file(self.target_file_name)
+            else:
+                raise ValueError("invalid targets")
+        finally:
+            if cache is not None:
+                stats = cache.stats()
+                safe_print(
+                    f"Cache hits: {stats['hits']} misses: {stats['misses']} "
+                    f"entries: {stats['entries']}"
+                )
+                self.metrics.record_cache(stats["hits"], stats["misses"])
+                blocks.client.cache = None
+                cache.close()
+            blocks.client.metrics = None
+            blocks.client.close()
+            self._write_metrics()
+            if (brief := self.metrics.brief()) is not None:
+                safe_print(f"Processed {brief}")
+            if self.profiler is not None:
+                self.profiler.report(settings.PROFILE_HOT_FUNCTIONS)
+
+    def _write_metrics(self) -> None:
+        if self.metrics_path:
+            self.metrics.write_json(self.metrics_path)
+        if self.prometheus_path:
+            self.metrics.write_prometheus(self.prometheus_path)
@@ -0,0 +1,13 @@
+import traceback
+from threading import Lock
+
+_print_lock = Lock()
+
+
+def safe_print(*args, **kwargs) -> None:
+    with _print_lock:
+        print(*args, **kwargs)
+
+
+def print_exc() -> None:
+    safe_print(traceback.format_exc(), end="")
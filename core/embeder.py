@@ -1,32 +1,100 @@
-from typing import List
-import fileinput
-import sys
+import ast
+import hashlib
+import time
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Tuple
 
-from models.blocks import CodeBlock
-from client.service import AiClient
+from parsers.base_parser import detect_newline, hash_source, split_lines, write_atomic
+
+DocNode = ast.FunctionDef | ast.AsyncFunctionDef | ast.ClassDef | ast.Module
+
+
+class DocstringSpan(NamedTuple):
+    start: int
+    end: int
+    # written in place of the docstring, keeps bodies that only held one valid
+    replacement: str | None
+
+
+# spans arrive in ast.walk order and are sorted by line once, so stripping is
+# a single cursor pass over the lines
+class DocstringIndex:
+    def __init__(self, spans: Iterable[DocstringSpan] = ()) -> None:
+        self.spans: List[DocstringSpan] = sorted(spans)
+
+    def __len__(self) -> int:
+        return len(self.spans)
+
+    def by_start(self) -> Dict[int, DocstringSpan]:
+        return {span.start: span for span in self.spans}
+
+    def strip(self, lines: List[str]) -> Iterator[str]:
+        cursor = 0
+        for span in self.spans:
+            yield from lines[cursor : span.start]
+            if span.replacement is not None:
+                yield span.replacement
+            cursor = span.end
+        yield from lines[cursor:]
 
 
 class DocstringManager:
-    def __init__(
-        self, client: AiClient,
-        code_blocks: List[CodeBlock]
-    ) -> None:
-        self.client = client
-        self.code_blocks = code_blocks
-
-
-    def _is_line_in_ranges(self, line_number) -> bool:
-        for node in self.code_blocks:
-            if node.doc_string is None:
-                return False
-            position = node.doc_string.position
-            if position.body_start + 1 <= line_number <= position.body_end:
-                return True
-        return False
-
-    def remove_doc_strings(self) -> None:
-        with fileinput.input(files=[self.file_name], inplace=True, mode='r') as file:
-            for line in file:
-                line_number = fileinput.filelineno()
-                if not self._is_line_in_ranges(line_number):
-                    sys.stdout.write(line)
+    def __init__(self, file_name: str) -> None:
+        self.file_name = file_name
+        self.source_hash = ""
+
+    # the one place deciding which docstrings can be cut, -R, --r and the
+    # daemon all go through it
+    def _find_span(self, node: DocNode, lines: List[str]) -> DocstringSpan | None:
+        if not node.body or ast.get_docstring(node, clean=False) is None:
+            return None
+        doc_node = node.body[0]
+        start, end = doc_node.lineno - 1, doc_node.end_lineno
+        # docstrings sharing a line with other code cannot be cut out by line
+        if lines[start][: doc_node.col_offset].strip():
+            return None
+        if len(node.body) > 1 and node.body[1].lineno == end:
+            return None
+        replacement = None
+        if len(node.body) == 1 and not isinstance(node, ast.Module):
+            replacement = lines[start][: doc_node.col_offset] + "pass\n"
+        return DocstringSpan(start, end, replacement)  # type: ignore
+
+    def find_doc_strings(self, source: str, lines: List[str]) -> DocstringIndex:
+        tree = ast.parse(source, filename=self.file_name)
+        spans = (
+            self._find_span(node, lines)
+            for node in ast.walk(tree)
+            if isinstance(
+                node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Module)
+            )
+        )
+        return DocstringIndex(span for span in spans if span is not None)
+
+    def remove_doc_strings(self) -> bool:
+        with open(self.file_name, "r", encoding="utf8") as file:
+            source = file.read()
+            newline = detect_newline(file.newlines)
+        lines = split_lines(source)
+        index = self.find_doc_strings(source, lines)
+        if not len(index):
+            self.source_hash = hash_source(source)
+            return False
+
+        digest = hashlib.sha256()
+
+        def hashed(stripped: Iterator[str]) -> Iterator[str]:
+            for line in stripped:
+                digest.update(line.encode("utf8"))
+                yield line
+
+        write_atomic(self.file_name, hashed(index.strip(lines)), newline)
+        self.source_hash = digest.hexdigest()
+        return True
+
+
+# process pool entry point for -R over a whole tree
+def strip_file(file_name: str) -> Tuple[str, bool, float]:
+    start = time.perf_counter()
+    manager = DocstringManager(file_name)
+    changed = manager.remove_doc_strings()
+    return manager.source_hash, changed, time.perf_counter() - start
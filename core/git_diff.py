@@ -0,0 +1,76 @@
+import os
+import re
+import subprocess
+from typing import Dict, List, Set, Tuple
+
+# zero based, end exclusive line ranges on the new side of the diff
+LineRanges = List[Tuple[int, int]]
+
+HUNK_HEADER = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+
+
+def _git(cwd: str, *args: str) -> str:
+    result = subprocess.run(
+        ["git", "-c", "core.quotePath=false", *args],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        encoding="utf8",
+    )
+    if result.returncode != 0:
+        raise ValueError(f"git {args[0]} failed: {result.stderr.strip()}")
+    return result.stdout
+
+
+# the absolute path, a directory to run git in and the repository root
+def _locate(path: str) -> Tuple[str, str, str]:
+    path = os.path.abspath(path)
+    cwd = path if os.path.isdir(path) else os.path.dirname(path)
+    return path, cwd, _git(cwd, "rev-parse", "--show-toplevel").strip()
+
+
+def parse_diff(diff: str, top_level: str) -> Dict[str, LineRanges]:
+    changes: Dict[str, LineRanges] = {}
+    current = None
+    for line in diff.splitlines():
+        if line.startswith("+++ "):
+            target = line[4:]
+            # deleted files have nothing left to document
+            current = None
+            if target != "/dev/null":
+                current = os.path.realpath(os.path.join(top_level, target))
+                changes.setdefault(current, [])
+        elif current is not None and (match := HUNK_HEADER.match(line)):
+            start = int(match.group(1))
+            count = 1 if match.group(2) is None else int(match.group(2))
+            if count:
+                changes[current].append((start - 1, start - 1 + count))
+            else:
+                # a pure deletion after line `start`, it touches the block around it
+                changes[current].append((max(start - 1, 0), max(start, 1)))
+    return changes
+
+
+# Lines changed under `path` by the staged changes, or since `since` in the
+# working tree, keyed by real path. Read from a zero context diff, so only the
+# files in the diff are ever looked at.
+def changed_lines(
+    path: str, since: str | None = None, staged: bool = False
+) -> Dict[str, LineRanges]:
+    path, cwd, top_level = _locate(path)
+    args = ["diff", "--unified=0", "--no-color", "--no-ext-diff", "--no-prefix"]
+    if staged:
+        args.append("--cached")
+    if since:
+        args.append(since)
+    return parse_diff(_git(cwd, *args, "--", path), top_level)
+
+
+# Files under `path` whose working tree differs from the index, by real path.
+# Staged line numbers do not match their contents on disk.
+def unstaged_paths(path: str) -> Set[str]:
+    path, cwd, top_level = _locate(path)
+    names = _git(cwd, "diff", "--name-only", "--no-ext-diff", "--", path)
+    return {
+        os.path.realpath(os.path.join(top_level, name)) for name in names.splitlines()
+    }
@@ -0,0 +1,110 @@
+import json
+import os
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+
+class JobRecord(NamedTuple):
+    id: str
+    path: str
+    # the file when it was planned, and the block's own lines within it
+    file_sha256: str
+    block: str
+    block_sha256: str
+    prompt: str
+    # the model route picked when planning, None for the client's own model
+    route: str | None = None
+
+
+# An append only JSONL log of one plan/execute/apply run. The header and the
+# planned blocks come first, results and batch submissions are appended as
+# they arrive, so a run stopped at any point resumes from what was written.
+class JobFile:
+    VERSION = 1
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.options: Dict = {}
+        self.records: Dict[str, JobRecord] = {}
+        self.results: Dict[str, str] = {}
+        # submitted batches not yet collected, one per route, as their route
+        # and record ids by batch id
+        self.open_batches: Dict[str, Tuple[str | None, List[str]]] = {}
+
+    def create(self, options: Dict) -> None:
+        self.options = options
+        with open(self.path, "w", encoding="utf8") as f:
+            f.write(
+                json.dumps({"type": "header", "version": JobFile.VERSION, **options})
+                + "\n"
+            )
+
+    def load(self) -> None:
+        with open(self.path, "rb+") as f:
+            data = f.read()
+            # a line cut short by a crash mid write, its entry is redone
+            complete = data.rfind(b"\n") + 1
+            if complete < len(data):
+                f.truncate(complete)
+
+        for line in data[:complete].decode("utf8").splitlines():
+            entry = json.loads(line)
+            kind = entry.pop("type")
+            if kind == "header":
+                if entry.pop("version") != JobFile.VERSION:
+                    raise ValueError(f"Unsupported job file version in {self.path}")
+                self.options = entry
+            elif kind == "block":
+                self.records[entry["id"]] = JobRecord(**entry)
+            elif kind == "result":
+                self.results[entry["id"]] = entry["content"]
+            elif kind == "batch":
+                self.open_batches[entry["id"]] = (entry.get("route"), entry["ids"])
+            elif kind == "batch_done":
+                self.open_batches.pop(entry["id"], None)
+
+    def pending(self) -> List[JobRecord]:
+        return [
+            record
+            for record_id, record in self.records.items()
+            if record_id not in self.results
+        ]
+
+    # pending and not waiting in an open batch
+    def unsubmitted(self) -> List[JobRecord]:
+        submitted = {
+            record_id
+            for _, record_ids in self.open_batches.values()
+            for record_id in record_ids
+        }
+        return [record for record in self.pending() if record.id not in submitted]
+
+    def add_records(self, records: Iterable[JobRecord]) -> None:
+        records = list(records)
+        self._append({"type": "block", **record._asdict()} for record in records)
+        self.records.update((record.id, record) for record in records)
+
+    def add_results(self, results: Dict[str, str]) -> None:
+        self._append(
+            {"type": "result", "id": record_id, "content": content}
+            for record_id, content in results.items()
+        )
+        self.results.update(results)
+
+    def start_batch(
+        self, batch_id: str, route: str | None, record_ids: List[str]
+    ) -> None:
+        self._append(
+            [{"type": "batch", "id": batch_id, "route": route, "ids": record_ids}]
+        )
+        self.open_batches[batch_id] = (route, record_ids)
+
+    def finish_batch(self, batch_id: str) -> None:
+        self._append([{"type": "batch_done", "id": batch_id}])
+        self.open_batches.pop(batch_id, None)
+
+    # on disk before returning, a checkpoint is never lost to a crash after it
+    def _append(self, entries: Iterable[Dict]) -> None:
+        with open(self.path, "a", encoding="utf8") as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in entries)
+            f.flush()
+            os.fsync(f.fileno())
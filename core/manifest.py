@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass
+from threading import Lock
+from typing import Dict, Set
+
+from parsers.base_parser import hash_source
+
+
+@dataclass
+class ManifestEntry:
+    sha256: str
+    mtime_ns: int
+    size: int
+
+
+class Manifest:
+    FILE_NAME = ".auto_doc_manifest.json"
+    VERSION = 2
+
+    def __init__(self, root: str, signature: str, rebuild: bool = False) -> None:
+        self.root = root
+        self.path = os.path.join(root, Manifest.FILE_NAME)
+        self.signature = signature
+        self.skipped = 0
+        self._lock = Lock()
+        self._seen: Set[str] = set()
+        self._entries: Dict[str, ManifestEntry] = {} if rebuild else self._load()
+
+    def _load(self) -> Dict[str, ManifestEntry]:
+        try:
+            with open(self.path, "r", encoding="utf8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        # entries recorded under different options (e.g. -R vs --r) are stale
+        if (
+            data.get("version") != Manifest.VERSION
+            or data.get("signature") != self.signature
+        ):
+            return {}
+        return {path: ManifestEntry(**entry) for path, entry in data["files"].items()}
+
+    def _key(self, file_path: str) -> str:
+        return os.path.relpath(file_path, self.root)
+
+    @staticmethod
+    def _hash(content: bytes) -> str:
+        return hashlib.sha256(content).hexdigest()
+
+    def is_unchanged(self, file_path: str) -> bool:
+        key = self._key(file_path)
+        stat = os.stat(file_path)
+        with self._lock:
+            self._seen.add(key)
+            entry = self._entries.get(key)
+        if entry is None or entry.size != stat.st_size:
+            return False
+
+        if entry.mtime_ns != stat.st_mtime_ns:
+            # touched but possibly identical, hashing is still cheaper than a rerun
+            with open(file_path, "rb") as f:
+                if self._hash(f.read()) != entry.sha256:
+                    return False
+            with self._lock:
+                entry.mtime_ns = stat.st_mtime_ns
+
+        with self._lock:
+            self.skipped += 1
+        return True
+
+    # Stores the hash of the bytes on disk, the one is_unchanged compares,
+    # source_hash is that of the text the run processed or wrote (see
+    # hash_source). A file edited since no longer holds that text and is left
+    # for the next run.
+    def record(self, file_path: str, source_hash: str) -> None:
+        with open(file_path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            content = f.read()
+        try:
+            # as a text mode read sees it, with universal newlines
+            text = content.decode("utf8").replace("\r\n", "\n").replace("\r", "\n")
+        except UnicodeDecodeError:
+            return
+        if hash_source(text) != source_hash:
+            return
+        key = self._key(file_path)
+        entry = ManifestEntry(
+            sha256=self._hash(content), mtime_ns=stat.st_mtime_ns, size=stat.st_size
+        )
+        with self._lock:
+            self._seen.add(key)
+            self._entries[key] = entry
+
+    def save(self) -> None:
+        with self._lock:
+            files = {
+                path: asdict(entry)
+                for path, entry in sorted(self._entries.items())
+                if path in self._seen
+            }
+        data = {
+            "version": Manifest.VERSION,
+            "signature": self.signature,
+            "files": files,
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf8") as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp_path, self.path)
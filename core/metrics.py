@@ -0,0 +1,256 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Dict, Iterator, List
+
+from client.schema import Completion
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
+
+PHASES = ("parse", "remove", "embed", "write")
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+@dataclass
+class ModelStats:
+    latencies: List[float] = field(default_factory=list)
+    errors: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+class Metrics:
+    def __init__(self, slowest_files: int = 20) -> None:
+        self.slowest_files = slowest_files
+        self._lock = Lock()
+        self._started = time.perf_counter()
+        self._file_phases: Dict[str, Dict[str, float]] = {}
+        self._file_totals: Dict[str, float] = {}
+        self._failed_files = 0
+        # unchanged since the last run or with nothing to do
+        self._skipped_files = 0
+        self._latencies: List[float] = []
+        self._request_errors = 0
+        self._retries = 0
+        self._prompt_tokens = 0
+        self._completion_tokens = 0
+        # latencies and token counts of each routed model
+        self._models: Dict[str, ModelStats] = {}
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self._queue_depth = 0
+        self._max_queue_depth = 0
+
+    @contextmanager
+    def phase(self, file_path: str, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_phase(file_path, name, time.perf_counter() - start)
+
+    def record_phase(self, file_path: str, name: str, seconds: float) -> None:
+        with self._lock:
+            phases = self._file_phases.setdefault(file_path, {})
+            phases[name] = phases.get(name, 0.0) + seconds
+
+    def record_file(
+        self,
+        file_path: str,
+        seconds: float,
+        failed: bool = False,
+        skipped: bool = False,
+    ) -> None:
+        with self._lock:
+            self._file_totals[file_path] = seconds
+            self._failed_files += failed
+            self._skipped_files += skipped
+
+    def record_request(
+        self, seconds: float, completion: Completion | None, model: str = ""
+    ) -> None:
+        with self._lock:
+            self._latencies.append(seconds)
+            stats = self._models.setdefault(model, ModelStats())
+            stats.latencies.append(seconds)
+            if completion is None:
+                self._request_errors += 1
+                stats.errors += 1
+                return
+            self._prompt_tokens += completion.prompt_tokens
+            self._completion_tokens += completion.completion_tokens
+            stats.prompt_tokens += completion.prompt_tokens
+            stats.completion_tokens += completion.completion_tokens
+
+    def record_retry(self) -> None:
+        with self._lock:
+            self._retries += 1
+
+    def record_cache(self, hits: int, misses: int) -> None:
+        with self._lock:
+            self._cache_hits += hits
+            self._cache_misses += misses
+
+    def queue_put(self) -> None:
+        with self._lock:
+            self._queue_depth += 1
+            self._max_queue_depth = max(self._max_queue_depth, self._queue_depth)
+
+    def queue_take(self) -> None:
+        with self._lock:
+            self._queue_depth -= 1
+
+    def _histogram(self) -> Dict[str, int]:
+        buckets = {str(bound): 0 for bound in LATENCY_BUCKETS}
+        for latency in self._latencies:
+            for bound in LATENCY_BUCKETS:
+                if latency <= bound:
+                    buckets[str(bound)] += 1
+        buckets["+Inf"] = len(self._latencies)
+        return buckets
+
+    def summary(self) -> Dict:
+        with self._lock:
+            phase_totals = {
+                phase: sum(
+                    phases.get(phase, 0.0) for phases in self._file_phases.values()
+                )
+                for phase in PHASES
+            }
+            slowest = sorted(
+                self._file_totals.items(), key=lambda item: item[1], reverse=True
+            )[: self.slowest_files]
+            latencies = self._latencies
+            return {
+                "wall_time": time.perf_counter() - self._started,
+                "files": {
+                    "processed": len(self._file_totals),
+                    "failed": self._failed_files,
+                    "skipped": self._skipped_files,
+                    "slowest": [
+                        {
+                            "file": file_path,
+                            "seconds": seconds,
+                            "phases": self._file_phases.get(file_path, {}),
+                        }
+                        for file_path, seconds in slowest
+                    ],
+                },
+                "phases": phase_totals,
+                "llm": {
+                    "requests": len(latencies),
+                    "errors": self._request_errors,
+                    "retries": self._retries,
+                    "latency": {
+                        "mean": sum(latencies) / len(latencies) if latencies else 0.0,
+                        "p50": _percentile(latencies, 0.5),
+                        "p95": _percentile(latencies, 0.95),
+                        "max": max(latencies, default=0.0),
+                        "buckets": self._histogram(),
+                    },
+                    "tokens": {
+                        "prompt": self._prompt_tokens,
+                        "completion": self._completion_tokens,
+                    },
+                    "models": {
+                        model: {
+                            "requests": len(stats.latencies),
+                            "errors": stats.errors,
+                            "p50": _percentile(stats.latencies, 0.5),
+                            "p95": _percentile(stats.latencies, 0.95),
+                            "tokens": {
+                                "prompt": stats.prompt_tokens,
+                                "completion": stats.completion_tokens,
+                            },
+                        }
+                        for model, stats in sorted(self._models.items())
+                    },
+                },
+                "cache": {"hits": self._cache_hits, "misses": self._cache_misses},
+                "queue": {"max_depth": self._max_queue_depth},
+            }
+
+    def prometheus(self) -> str:
+        summary = self.summary()
+        llm = summary["llm"]
+        lines = [
+            "# HELP auto_doc_phase_seconds_total Wall time spent per pipeline phase.",
+            "# TYPE auto_doc_phase_seconds_total counter",
+        ]
+        lines += [
+            f'auto_doc_phase_seconds_total{{phase="{phase}"}} {seconds}'
+            for phase, seconds in summary["phases"].items()
+        ]
+        lines += [
+            "# HELP auto_doc_llm_request_seconds Model request latency.",
+            "# TYPE auto_doc_llm_request_seconds histogram",
+        ]
+        lines += [
+            f'auto_doc_llm_request_seconds_bucket{{le="{bound}"}} {count}'
+            for bound, count in llm["latency"]["buckets"].items()
+        ]
+        with self._lock:
+            latency_sum = sum(self._latencies)
+        tokens = llm["tokens"]
+        lines += [
+            f"auto_doc_llm_request_seconds_sum {latency_sum}",
+            f"auto_doc_llm_request_seconds_count {llm['requests']}",
+            "# TYPE auto_doc_llm_tokens_total counter",
+            f'auto_doc_llm_tokens_total{{kind="prompt"}} {tokens["prompt"]}',
+            f'auto_doc_llm_tokens_total{{kind="completion"}} {tokens["completion"]}',
+            "# TYPE auto_doc_llm_errors_total counter",
+            f"auto_doc_llm_errors_total {llm['errors']}",
+            "# TYPE auto_doc_llm_retries_total counter",
+            f"auto_doc_llm_retries_total {llm['retries']}",
+            "# TYPE auto_doc_cache_hits_total counter",
+            f"auto_doc_cache_hits_total {summary['cache']['hits']}",
+            "# TYPE auto_doc_cache_misses_total counter",
+            f"auto_doc_cache_misses_total {summary['cache']['misses']}",
+            "# TYPE auto_doc_files_processed_total counter",
+            f"auto_doc_files_processed_total {summary['files']['processed']}",
+            "# TYPE auto_doc_files_failed_total counter",
+            f"auto_doc_files_failed_total {summary['files']['failed']}",
+            "# TYPE auto_doc_files_skipped_total counter",
+            f"auto_doc_files_skipped_total {summary['files']['skipped']}",
+            "# TYPE auto_doc_queue_depth_max gauge",
+            f"auto_doc_queue_depth_max {summary['queue']['max_depth']}",
+            "# TYPE auto_doc_run_seconds gauge",
+            f"auto_doc_run_seconds {summary['wall_time']}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    # printed after every run that saw files, the full summary is only written
+    # with --metrics
+    def brief(self) -> str | None:
+        with self._lock:
+            if not self._file_totals:
+                return None
+            files = len(self._file_totals)
+            return (
+                f"{files} file{'s' if files != 1 else ''} in "
+                f"{time.perf_counter() - self._started:.1f}s, "
+                f"{self._failed_files} failed, {self._skipped_files} skipped, "
+                f"{len(self._latencies)} model requests"
+            )
+
+    @staticmethod
+    def _write_atomic(path: str, content: str) -> None:
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def write_json(self, path: str) -> None:
+        self._write_atomic(path, json.dumps(self.summary(), indent=2))
+
+    def write_prometheus(self, path: str) -> None:
+        self._write_atomic(path, self.prometheus())
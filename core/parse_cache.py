@@ -0,0 +1,40 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Tuple
+
+from models.blocks import BlockTable
+
+
+# Parsed blocks keyed by path and the sha256 of the source they came from, so
+# the daemon parses a file once however often editors send the same buffer.
+# The path is part of the key because module blocks are named after it.
+# Least recently used tables are dropped past max_entries.
+class ParseCache:
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Tuple[str, str], BlockTable] = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, file_path: str, source_hash: str) -> BlockTable | None:
+        key = (file_path, source_hash)
+        with self._lock:
+            block_table = self._entries.get(key)
+            if block_table is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return block_table
+
+    def set(self, file_path: str, source_hash: str, block_table: BlockTable) -> None:
+        key = (file_path, source_hash)
+        with self._lock:
+            self._entries[key] = block_table
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
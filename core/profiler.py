@@ -0,0 +1,152 @@
+import cProfile
+import heapq
+import io
+import itertools
+import os
+import pstats
+import re
+import time
+import tracemalloc
+import zlib
+from contextlib import contextmanager
+from threading import Lock
+from typing import Iterator, List, Tuple
+
+from core.console import safe_print
+
+
+# Profiles a sampled fraction of files, each in the worker thread processing
+# it, so only the sampled files pay cProfile's overhead. Every profile is
+# summed into one hot function table, only the slowest and most memory hungry
+# files keep reports of their own.
+#
+# tracemalloc is process wide, a file's allocations also count those of the
+# files processed alongside it, they are exact with -T 1.
+class FileProfiler:
+    def __init__(
+        self,
+        output_dir: str,
+        sample_rate: float = 1.0,
+        top_files: int = 10,
+        trace_memory: bool = False,
+        allocation_lines: int = 25,
+    ) -> None:
+        self.output_dir = output_dir
+        self.sample_rate = sample_rate
+        self.top_files = top_files
+        self.trace_memory = trace_memory
+        self.allocation_lines = allocation_lines
+        self.sampled = 0
+        self._lock = Lock()
+        self._order = itertools.count()
+        self._aggregate: pstats.Stats | None = None
+        # min heaps, the smallest kept entry is the first one evicted
+        self._slowest: List[Tuple[float, int, str, cProfile.Profile]] = []
+        self._hungriest: List[Tuple[int, int, str, List[str]]] = []
+
+    # by path, so a rerun samples the same files
+    def samples(self, file_path: str) -> bool:
+        return zlib.crc32(file_path.encode("utf8")) < self.sample_rate * 2**32
+
+    def start(self) -> None:
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    # snapshots are taken outside the profiled region, so they never show up
+    # among the hot functions
+    @contextmanager
+    def profile(self, file_path: str) -> Iterator[None]:
+        if not self.samples(file_path):
+            yield
+            return
+        before = tracemalloc.take_snapshot() if self.trace_memory else None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ allows one active profiler, another file has it
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            profile.disable()
+            seconds = time.perf_counter() - start
+            allocations: List[tracemalloc.StatisticDiff] = []
+            if before is not None:
+                allocations = [
+                    stat
+                    for stat in tracemalloc.take_snapshot().compare_to(before, "lineno")
+                    # the first snapshot itself
+                    if stat.traceback[0].filename != tracemalloc.__file__
+                ]
+            self._record(file_path, seconds, profile, allocations)
+
+    def _record(
+        self,
+        file_path: str,
+        seconds: float,
+        profile: cProfile.Profile,
+        allocations: List[tracemalloc.StatisticDiff],
+    ) -> None:
+        allocated = sum(max(stat.size_diff, 0) for stat in allocations)
+        # only the lines a report shows are kept, not the snapshots
+        top_lines = [str(stat) for stat in allocations[: self.allocation_lines]]
+        with self._lock:
+            self.sampled += 1
+            if self._aggregate is None:
+                self._aggregate = pstats.Stats(profile)
+            else:
+                self._aggregate.add(profile)
+            order = next(self._order)
+            self._keep(self._slowest, (seconds, order, file_path, profile))
+            if allocations:
+                self._keep(self._hungriest, (allocated, order, file_path, top_lines))
+
+    def _keep(self, heap: List, entry: Tuple) -> None:
+        heapq.heappush(heap, entry)
+        if len(heap) > self.top_files:
+            heapq.heappop(heap)
+
+    def _report_path(self, rank: int, file_path: str, suffix: str) -> str:
+        name = re.sub(r"[^\w.-]+", "_", file_path.strip(os.sep))
+        return os.path.join(self.output_dir, f"{rank:02d}_{name}{suffix}")
+
+    # Dumps the kept reports and prints the hot functions over every sampled
+    # file. The .pstats files load into pstats, snakeviz or gprof2dot.
+    def report(self, hot_functions: int = 25) -> None:
+        if self.trace_memory:
+            tracemalloc.stop()
+        if self._aggregate is None:
+            safe_print("No files profiled")
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        slowest = sorted(self._slowest, reverse=True)
+        for rank, (seconds, _, file_path, profile) in enumerate(slowest):
+            profile.dump_stats(self._report_path(rank, file_path, ".pstats"))
+        hungriest = sorted(self._hungriest, reverse=True)
+        for rank, (allocated, _, file_path, top_lines) in enumerate(hungriest):
+            with open(
+                self._report_path(rank, file_path, ".alloc.txt"), "w", encoding="utf8"
+            ) as f:
+                f.write(f"{file_path}: {allocated / 1024:.1f} KiB allocated\n\n")
+                f.writelines(line + "\n" for line in top_lines)
+
+        self._aggregate.dump_stats(os.path.join(self.output_dir, "aggregate.pstats"))
+        table = io.StringIO()
+        self._aggregate.stream = table  # type: ignore
+        self._aggregate.sort_stats("tottime").print_stats(hot_functions)
+        with open(
+            os.path.join(self.output_dir, "hot_functions.txt"), "w", encoding="utf8"
+        ) as f:
+            f.write(table.getvalue())
+
+        safe_print(f"Profiled {self.sampled} files, reports in {self.output_dir}")
+        for seconds, _, file_path, _ in slowest:
+            safe_print(f"  {seconds:8.3f}s  {file_path}")
+        for allocated, _, file_path, _ in hungriest:
+            safe_print(f"  {allocated / 1024:8.1f} KiB  {file_path}")
+        safe_print(table.getvalue())
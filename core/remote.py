@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# Thin client for a `main.py --serve` daemon, for editors and pre-commit hooks.
+# It only imports the standard library, so a call costs an interpreter start
+# and one round trip instead of a full run.
+import argparse
+import http.client
+import json
+import os
+import socket
+import sys
+from typing import Dict, List
+
+# core.settings.SERVER_SOCKET, repeated so the script runs on its own
+SERVER_SOCKET = os.environ.get(
+    "AUTO_DOC_SOCKET",
+    os.path.join(os.path.expanduser("~"), ".cache", "auto_doc", "daemon.sock"),
+)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float | None = None) -> None:
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def request(
+    connection: http.client.HTTPConnection, files: List[Dict], output_format: str
+) -> List[Dict]:
+    payload = json.dumps({"files": files, "format": output_format})
+    connection.request(
+        "POST", "/document", payload, {"Content-Type": "application/json"}
+    )
+    response = connection.getresponse()
+    body = json.loads(response.read())
+    if response.status != 200:
+        raise RuntimeError(body.get("error", f"HTTP {response.status}"))
+    return body["results"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Send files to a running documentation daemon."
+    )
+    parser.add_argument("files", nargs="+", help="Files to document")
+    parser.add_argument("--socket", dest="socket_path", default=SERVER_SOCKET)
+    parser.add_argument(
+        "--port", type=int, help="Talk to a daemon serving on a localhost port"
+    )
+    parser.add_argument(
+        "--stdin",
+        action="store_true",
+        help="Document stdin as the single file given and print the result",
+    )
+    parser.add_argument(
+        "--diff", action="store_true", help="Print a diff instead of the new text"
+    )
+    args = parser.parse_args()
+
+    if args.port is not None:
+        connection = http.client.HTTPConnection("127.0.0.1", args.port)
+    else:
+        connection = UnixHTTPConnection(args.socket_path)
+
+    if args.stdin:
+        if len(args.files) != 1:
+            parser.error("--stdin takes exactly one file path")
+        files = [{"path": os.path.abspath(args.files[0]), "content": sys.stdin.read()}]
+    else:
+        files = [{"path": os.path.abspath(path)} for path in args.files]
+
+    try:
+        results = request(connection, files, "diff" if args.diff else "text")
+    except (OSError, RuntimeError) as e:
+        print(f"Documentation daemon unavailable: {e}", file=sys.stderr)
+        sys.exit(2)
+
+    failed = False
+    for result in results:
+        if "error" in result:
+            failed = True
+            message = f"Error processing file {result['path']}: {result['error']}"
+            print(message, file=sys.stderr)
+        elif args.diff:
+            sys.stdout.write(result["diff"])
+        elif args.stdin:
+            sys.stdout.write(result["content"])
+        elif result["changed"]:
+            print(f"Documented {result['path']}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
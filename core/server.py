@@ -0,0 +1,192 @@
+import difflib
+import errno
+import json
+import os
+import socket
+import socketserver
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock
+from typing import Dict, List
+
+from client.backends import BackendError
+from core import settings
+from core.app import App
+from core.parse_cache import ParseCache
+from parsers.base_parser import split_lines
+
+
+class UnixHTTPServer(ThreadingHTTPServer):
+    address_family = socket.AF_UNIX
+
+    def __init__(self, socket_path: str, handler: type[BaseHTTPRequestHandler]) -> None:
+        # an AF_UNIX address is the socket path, the stubs only allow (host, port)
+        super().__init__(socket_path, handler)  # type: ignore[arg-type]
+
+    def server_bind(self) -> None:
+        # HTTPServer.server_bind expects a (host, port) address
+        socketserver.TCPServer.server_bind(self)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+
+def make_handler(doc_server: "DocServer") -> type[BaseHTTPRequestHandler]:
+    class DocumentHandler(BaseHTTPRequestHandler):
+        # keep-alive, editors hold one connection open across requests
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, status: int, body: Dict) -> None:
+            payload = json.dumps(body).encode("utf8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self) -> None:
+            if self.path != "/health":
+                self._send_json(404, {"error": "Not found"})
+                return
+            self._send_json(200, doc_server.stats())
+
+        def do_POST(self) -> None:
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                request = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                self._send_json(400, {"error": "Invalid JSON"})
+                return
+            if self.path != "/document":
+                self._send_json(404, {"error": "Not found"})
+                return
+            files = request.get("files")
+            if not isinstance(files, list):
+                self._send_json(400, {"error": "Expected a list of files"})
+                return
+            self._send_json(
+                200, {"results": doc_server.document(files, request.get("format"))}
+            )
+
+        def log_message(self, format: str, *args) -> None:
+            pass
+
+    return DocumentHandler
+
+
+def daemon_listening(socket_path: str) -> bool:
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except OSError:
+        return False
+    finally:
+        probe.close()
+    return True
+
+
+# Hosts one App for editors and pre-commit hooks. Callers share its warm
+# backend client, response cache and parse cache, and every request is run
+# on one worker pool, so concurrent callers queue instead of oversubscribing.
+#
+# POST /document {"files": [{"path": ..., "content": ...}], "format": "diff"}
+# documents each file. A file sent with content is an editor buffer and is
+# answered with the new text, a bare path is documented on disk in place.
+class DocServer:
+    def __init__(
+        self,
+        app: App,
+        socket_path: str | None = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        self.app = app
+        self.parse_cache = ParseCache(settings.SERVER_PARSE_CACHE_SIZE)
+        self.executor = ThreadPoolExecutor(max_workers=app.num_workers)
+        self.requests = 0
+        self._requests_lock = Lock()
+        handler = make_handler(self)
+        if socket_path is not None:
+            if os.path.exists(socket_path):
+                if daemon_listening(socket_path):
+                    raise OSError(
+                        errno.EADDRINUSE,
+                        f"A documentation daemon is already serving on {socket_path}",
+                    )
+                # left behind by a daemon that did not shut down cleanly
+                os.unlink(socket_path)
+            os.makedirs(os.path.dirname(os.path.abspath(socket_path)), exist_ok=True)
+            self.httpd: ThreadingHTTPServer = UnixHTTPServer(socket_path, handler)
+        else:
+            self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.socket_path = socket_path
+
+    @property
+    def address(self) -> str:
+        if self.socket_path is not None:
+            return self.socket_path
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host!s}:{port}"
+
+    def stats(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "parse_cache": {
+                "entries": len(self.parse_cache),
+                "hits": self.parse_cache.hits,
+                "misses": self.parse_cache.misses,
+            },
+        }
+
+    def _document_one(self, file: Dict, output_format: str | None) -> Dict:
+        path = file.get("path")
+        if not isinstance(path, str):
+            return {"path": path, "error": "Missing path"}
+        content = file.get("content")
+        try:
+            if content is None:
+                before, after = self.app.document_file(path, self.parse_cache)
+            else:
+                before = content.replace("\r\n", "\n")
+                after = self.app.document_buffer(path, before, self.parse_cache)
+                if "\r\n" in content:
+                    after = after.replace("\n", "\r\n")
+                    before = content
+        except (ValueError, SyntaxError, OSError, BackendError) as e:
+            return {"path": path, "error": str(e)}
+
+        result = {"path": path, "changed": after != before}
+        if output_format == "diff":
+            result["diff"] = "".join(
+                difflib.unified_diff(
+                    split_lines(before),
+                    split_lines(after),
+                    fromfile=path,
+                    tofile=path,
+                )
+            )
+        elif content is not None:
+            result["content"] = after
+        return result
+
+    def document(self, files: List[Dict], output_format: str | None) -> List[Dict]:
+        # handlers run on threads of their own
+        with self._requests_lock:
+            self.requests += 1
+        futures = [
+            self.executor.submit(self._document_one, file, output_format)
+            for file in files
+        ]
+        return [future.result() for future in futures]
+
+    def serve_forever(self) -> None:
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.httpd.server_close()
+            self.executor.shutdown()
+            if self.socket_path is not None and os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def shutdown(self) -> None:
+        self.httpd.shutdown()
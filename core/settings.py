@@ -1,3 +1,5 @@
+import os
+
 IGNORED_DIRS_SET = {
     '.venv', 'venv',               # Virtual environments
     '.env',                        # Environment variable files
@@ -16,7 +18,6 @@ IGNORED_DIRS_SET = {
     '.tox',                        # tox virtual environment
     '.sass-cache',                 # Sass/CSS caching
     '.cache',                      # General cache directory
-    '.dockerignore',               # Docker ignore file
     '.hypothesis',                 # Hypothesis testing framework storage
     '.eggs',                       # Egg package directories
     'eggs',                        # Egg package directories
@@ -32,8 +33,72 @@ IGNORED_DIRS_SET = {
     '.yarn-cache',                 # Yarn cache directory
     'htmlcov',                     # Coverage HTML files
     'doc', 'docs',                 # Documentation directories
-    '.DS_Store',                   # macOS filesystem file
-    'Thumbs.db'                    # Windows image file cache
 }
 
 WORKER_COUNT = 4
+
+# files walked ahead of the workers before the walk waits for them to catch up
+MAX_PENDING_FILES = 256
+
+# processes parsing files ahead of the worker threads, 0 parses in the threads
+PARSE_WORKERS = os.cpu_count() or 1
+
+MAX_CONCURRENT_REQUESTS = 8
+
+BATCH_TOKEN_BUDGET = 2000
+
+BATCH_MAX_BLOCKS = 8
+
+# most tokens of code sent for one block, larger samples are cut off
+PROMPT_TOKEN_BUDGET = 1000
+
+# docstrings are asked to fit this width once indented
+DOCSTRING_LINE_LENGTH = 88
+
+# 0 leaves the limit to the API, set these to the account's quota
+REQUESTS_PER_MINUTE = 0
+
+TOKENS_PER_MINUTE = 0
+
+MAX_RETRIES = 5
+
+BACKOFF_BASE = 1.0
+
+BACKOFF_MAX = 60.0
+
+CIRCUIT_FAILURE_THRESHOLD = 5
+
+CIRCUIT_COOLDOWN = 30.0
+
+METRICS_SLOWEST_FILES = 20
+
+# --profile keeps reports for this many of the slowest and hungriest files,
+# and prints this many functions of the aggregated profile
+PROFILE_TOP_FILES = 10
+
+PROFILE_HOT_FUNCTIONS = 25
+
+PROFILE_ALLOCATION_LINES = 25
+
+# --watch waits for saves to go quiet this long before documenting a batch
+WATCH_DEBOUNCE = 0.3
+
+# seconds between scans when inotify is unavailable
+WATCH_POLL_INTERVAL = 1.0
+
+# --execute records results to the job file after every this many blocks
+JOB_CHECKPOINT_SIZE = 64
+
+# seconds between status checks of a submitted batch
+BATCH_POLL_INTERVAL = 30.0
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "auto_doc")
+
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# where --serve listens unless a port is given, and how many parsed files it keeps
+SERVER_SOCKET = os.environ.get(
+    "AUTO_DOC_SOCKET", os.path.join(CACHE_DIR, "daemon.sock")
+)
+
+SERVER_PARSE_CACHE_SIZE = 1024
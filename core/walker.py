@@ -0,0 +1,122 @@
+import os
+from typing import Collection, Iterator, List, Sequence, Tuple
+
+IGNORE_FILES = (".gitignore",)
+
+ROOT_IGNORE_FILES = (".gitignore", ".dockerignore")
+
+# (directory the ignore file lives in, compiled patterns)
+IgnoreSpecs = List[Tuple[str, object]]
+
+
+def _compile(patterns: Sequence[str]):
+    # pathspec costs ~40ms to import, single file and removal runs skip it
+    import pathspec
+
+    return pathspec.GitIgnoreSpec.from_lines(patterns)
+
+
+class SourceWalker:
+    def __init__(
+        self,
+        root: str,
+        extensions: Sequence[str] = (".py",),
+        ignored_dirs: Collection[str] = (),
+        include: Sequence[str] = (),
+        exclude: Sequence[str] = (),
+    ) -> None:
+        self.root = root
+        self.extensions = tuple(extensions)
+        self.ignored_dirs = set(ignored_dirs)
+        self._include = _compile(include) if include else None
+        self._exclude = _compile(exclude) if exclude else None
+
+    def _load_ignore_files(self, directory: str, names: Sequence[str]) -> IgnoreSpecs:
+        specs: IgnoreSpecs = []
+        for name in names:
+            path = os.path.join(directory, name)
+            try:
+                with open(path, "r", encoding="utf8") as f:
+                    specs.append((directory, _compile(f.read().splitlines())))
+            except (OSError, UnicodeDecodeError):
+                continue
+        return specs
+
+    def _is_ignored(self, path: str, is_dir: bool, specs: IgnoreSpecs) -> bool:
+        for base, spec in specs:
+            relative = os.path.relpath(path, base).replace(os.sep, "/")
+            if spec.match_file(relative + "/" if is_dir else relative):  # type: ignore
+                return True
+        if self._exclude is not None:
+            relative = os.path.relpath(path, self.root).replace(os.sep, "/")
+            if self._exclude.match_file(relative + "/" if is_dir else relative):
+                return True
+        return False
+
+    def _is_included(self, path: str) -> bool:
+        if self._include is None:
+            return True
+        return self._include.match_file(
+            os.path.relpath(path, self.root).replace(os.sep, "/")
+        )
+
+    # single path check for paths reported by a watcher, same rules as the walk
+    def matches(self, path: str, is_dir: bool = False) -> bool:
+        if not is_dir and not path.endswith(self.extensions):
+            return False
+        relative = os.path.relpath(path, self.root)
+        if relative.startswith(os.pardir):
+            return False
+        parts = relative.split(os.sep)
+        specs = self._load_ignore_files(self.root, ROOT_IGNORE_FILES)
+        directory = self.root
+        for part in parts if is_dir else parts[:-1]:
+            directory = os.path.join(directory, part)
+            if part in self.ignored_dirs or self._is_ignored(directory, True, specs):
+                return False
+            specs = specs + self._load_ignore_files(directory, IGNORE_FILES)
+        if is_dir:
+            return True
+        return not self._is_ignored(path, False, specs) and self._is_included(path)
+
+    # yields files while walking, so the first one is processed right away and
+    # only the directories still to visit are held in memory
+    def __iter__(self) -> Iterator[str]:
+        for path, is_dir in self._walk(files=True):
+            if not is_dir:
+                yield path
+
+    def directories(self) -> Iterator[str]:
+        for path, _ in self._walk(files=False):
+            yield path
+
+    def _walk(self, files: bool) -> Iterator[Tuple[str, bool]]:
+        stack = [(self.root, self._load_ignore_files(self.root, ROOT_IGNORE_FILES))]
+        while stack:
+            directory, specs = stack.pop()
+            yield directory, True
+            try:
+                entries = os.scandir(directory)
+            except OSError:
+                continue
+            subdirs = []
+            with entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name in self.ignored_dirs or self._is_ignored(
+                            entry.path, True, specs
+                        ):
+                            continue
+                        subdirs.append(entry.path)
+                    elif (
+                        files
+                        and entry.name.endswith(self.extensions)
+                        and entry.is_file()
+                        and not self._is_ignored(entry.path, False, specs)
+                        and self._is_included(entry.path)
+                    ):
+                        yield entry.path, False
+            for subdir in reversed(subdirs):
+                stack.append(
+                    (subdir, specs + self._load_ignore_files(subdir, IGNORE_FILES))
+                )
@@ -0,0 +1,164 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from typing import Dict, Iterator, List, Set, Tuple
+
+from core.walker import SourceWalker
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+# saves in place end with a close, atomic saves with a rename into place
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class InotifySource:
+    kind = "inotify"
+
+    def __init__(self, walker: SourceWalker) -> None:
+        self.walker = walker
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs: Dict[int, str] = {}
+        for directory in walker.directories():
+            self._add_watch(directory)
+
+    @classmethod
+    def available(cls) -> bool:
+        if not sys.platform.startswith("linux"):
+            return False
+        library = ctypes.util.find_library("c")
+        return library is not None and hasattr(ctypes.CDLL(library), "inotify_init1")
+
+    def _add_watch(self, directory: str) -> None:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+        # the directory may be gone already, or the watch limit reached
+        if wd >= 0:
+            self._dirs[wd] = directory
+
+    def _read_events(self) -> Iterator[Tuple[str, int]]:
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # events were dropped, anything under the root may have changed
+                yield from ((path, 0) for path in self.walker)
+            elif wd in self._dirs and name:
+                yield os.path.join(self._dirs[wd], os.fsdecode(name)), mask
+
+    def wait(self, timeout: float | None) -> List[str]:
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+        changed: List[str] = []
+        for path, mask in self._read_events():
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._watch_new_dir(path, changed)
+            elif not mask & IN_CREATE:
+                changed.append(path)
+        return changed
+
+    def _watch_new_dir(self, directory: str, changed: List[str]) -> None:
+        if not self.walker.matches(directory, is_dir=True):
+            return
+        walker = SourceWalker(
+            directory, self.walker.extensions, self.walker.ignored_dirs
+        )
+        for subdir in walker.directories():
+            self._add_watch(subdir)
+        # files can land in a new directory before its watch exists
+        changed.extend(walker)
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class PollingSource:
+    kind = "polling"
+
+    def __init__(self, walker: SourceWalker, interval: float) -> None:
+        self.walker = walker
+        self.interval = interval
+        self._stats = self._scan()
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        stats = {}
+        for path in self.walker:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            stats[path] = (stat.st_mtime_ns, stat.st_size)
+        return stats
+
+    def wait(self, timeout: float | None) -> List[str]:
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        stats = self._scan()
+        changed = [
+            path for path, stat in stats.items() if self._stats.get(path) != stat
+        ]
+        self._stats = stats
+        return changed
+
+    def close(self) -> None:
+        pass
+
+
+# Yields the files changed under the walker's root, a batch at a time once
+# saves have been quiet for the debounce interval, so an editor writing a
+# file several times or a branch checkout arrive as one batch.
+class FileWatcher:
+    def __init__(
+        self,
+        walker: SourceWalker,
+        debounce: float,
+        poll_interval: float,
+        polling: bool = False,
+    ) -> None:
+        self.walker = walker
+        self.debounce = debounce
+        if not polling and InotifySource.available():
+            self.source: InotifySource | PollingSource = InotifySource(walker)
+        else:
+            self.source = PollingSource(walker, poll_interval)
+
+    @property
+    def kind(self) -> str:
+        return self.source.kind
+
+    def __iter__(self) -> Iterator[Set[str]]:
+        pending: Set[str] = set()
+        while True:
+            changed = self.source.wait(self.debounce if pending else None)
+            pending.update(
+                path
+                for path in changed
+                if os.path.isfile(path) and self.walker.matches(path)
+            )
+            if not changed and pending:
+                yield pending
+                pending = set()
+
+    def close(self) -> None:
+        self.source.close()
@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 import os
 import sys
-import subprocess
 
 from core.app import App
 from parsers.cli_parser import cli_parser
@@ -12,6 +11,8 @@ def main() -> None:
 
     if args.command:
         raise NotImplemented('Not fully developed')
+        import subprocess
+
         process = subprocess.Popen(
             args.command,
             shell=True,
@@ -28,7 +29,11 @@ def main() -> None:
         else:
             sys.exit(1)
 
-    elif not args.target_file_name and not args.target_dir_name:
+    elif (
+        not (args.serve or args.execute_path or args.apply_path)
+        and not args.target_file_name
+        and not args.target_dir_name
+    ):
         print("Invalid arguments")
         parser.print_help()
         sys.exit(1)
@@ -1,7 +1,11 @@
-from typing import List
+import sys
+from array import array
 from dataclasses import dataclass
+from typing import Dict, Iterator, List
 
-from client.service import Prompt, AiClient
+from client.schema import Prompt
+from client.service import AiClient
+from core import settings
 
 
 prompt: Prompt = {
@@ -21,16 +25,27 @@ prompt: Prompt = {
 client = AiClient(prompt=prompt)
 
 
-@dataclass
+# first line of text without the quotes
+def summarize_docstring(doc_string: str) -> str:
+    for line in doc_string.splitlines():
+        text = line.strip().lstrip("rRuU").strip("\"'").strip()
+        if text:
+            return text
+    return ""
+
+
+@dataclass(slots=True)
 class Position:
     indent_level: int
     body_start: int
     body_end: int
 
 
-@dataclass
+@dataclass(slots=True)
 class CodePosition(Position):
     declaration_start: int
+    # column of the first statement in the body, where a docstring goes
+    body_indent: int = 0
     # @offset will help with getting lambda functions, offset from line start
     offset = int | None
     # @line_offset will capture preceding decorators
@@ -38,6 +53,7 @@ class CodePosition(Position):
 
 
 class DocString:
+    __slots__ = ("position", "doc_string")
 
     def __init__(
         self,
@@ -47,28 +63,17 @@ class DocString:
         self.position = position
         self.raw_doc_string = doc_str
 
-    @property
-    def doc_string(self) -> str:
-        return "".join(self.raw_doc_string)
-
+    # kept as one string, the lines are only split out when asked for
     @property
     def raw_doc_string(self) -> List[str]:
-        return self._raw_doc_string
+        return self.doc_string.splitlines(keepends=True)
 
     @raw_doc_string.setter
     def raw_doc_string(self, val: List[str] | str) -> None:
-        if isinstance(val, str):
-            self.raw_doc_string = val.splitlines(keepends=True)
-        else:
-            self._raw_doc_string = val
-
-    @property
-    def position(self) -> Position:
-        return self._position
+        self.doc_string = val if isinstance(val, str) else "".join(val)
 
-    @position.setter
-    def position(self, pos: Position) -> None:
-        self._position = pos
+    def summary(self) -> str:
+        return summarize_docstring(self.doc_string)
 
     def __len__(self) -> int:
         if self.position.body_end < 0:
@@ -76,7 +81,7 @@ class DocString:
         return self.position.body_end - self.position.body_start
 
     @classmethod
-    def generate_docstring(
+    def build_prompt(
         cls,
         name: str,
         object_type: str,
@@ -84,18 +89,46 @@ class DocString:
         file_type: str,
         max_line_length: int,
     ) -> str:
+        return (
+            f"Write a docstring for a {file_type} {object_type} named '{name}'.\n"
+            f"Each line should not exceed {max_line_length} characters for the "
+            f"following {object_type}:\n\n{code_sample}"
+        )
 
-        doc_str_prompt = f"""
-        Write a docstring for a {file_type} {object_type} named '{name}'.
-        Each line should not exceed {max_line_length} characters for the following
-        {object_type}:
-
-        {code_sample}
-        """
-        response = client.single_response(doc_str_prompt)
+    @classmethod
+    def generate_docstring(
+        cls,
+        name: str,
+        object_type: str,
+        code_sample: str,
+        file_type: str,
+        max_line_length: int,
+        route: str | None = None,
+    ) -> str:
+        doc_str_prompt = cls.build_prompt(
+            name, object_type, code_sample, file_type, max_line_length
+        )
+        response = client.single_response(doc_str_prompt, route)
 
         return response
 
+    @classmethod
+    def generate_docstrings(
+        cls,
+        doc_str_prompts: List[str],
+        max_concurrency: int,
+        batch_token_budget: int = 0,
+        max_batch_items: int = 8,
+        routes: List[str | None] | None = None,
+    ) -> List[str]:
+        return client.concurrent_responses(
+            doc_str_prompts,
+            max_concurrency,
+            batch_token_budget,
+            max_batch_items,
+            routes,
+        )
+
     @classmethod
     def format_to_docstring(
         cls,
@@ -104,6 +137,7 @@ class DocString:
         rep_doc_str_fmt: List[str],
         indent_level: int = 0,
         chars_skip: int = 3,
+        indentation: str | None = None,
     ) -> str:
         str_starts = [doc_string.startswith(str_fmt) for str_fmt in rep_doc_str_fmt]
         str_ends = [doc_string.endswith(str_fmt) for str_fmt in rep_doc_str_fmt]
@@ -113,7 +147,8 @@ class DocString:
         if any(str_ends):
             doc_string = doc_string[:-chars_skip]
 
-        indentation = " " * indent_level
+        if indentation is None:
+            indentation = " " * indent_level
         doc_string = doc_string.replace(allowed_doc_str_fmt[0], "")
         docstring_text = "\n".join(
             [indentation + line for line in doc_string.splitlines()]
@@ -133,6 +168,7 @@ class DocString:
 
 
 class CodeBlock:
+    __slots__ = ("name", "obj_type", "position", "doc_string", "children")
 
     def __init__(
         self,
@@ -145,6 +181,7 @@ class CodeBlock:
         self.obj_type = obj_type
         self.position = position
         self.doc_string = doc_string
+        self.children: List[CodeBlock] = []
 
     def __str__(self) -> str:
         return (
@@ -153,12 +190,37 @@ class CodeBlock:
         )
 
     @property
-    def doc_string(self) -> DocString | None:
-        return self._doc_string
+    def doc_str_indent_level(self) -> int:
+        return self.position.body_indent if self.obj_type != "module" else 0
+
+    @property
+    def doc_str_line_length(self) -> int:
+        return settings.DOCSTRING_LINE_LENGTH - self.doc_str_indent_level
 
-    @doc_string.setter
-    def doc_string(self, doc_str: DocString) -> None:
-        self._doc_string = doc_str
+    def build_prompt(self, code_sample: str, file_type: str) -> str:
+        return DocString.build_prompt(
+            name=self.name,
+            object_type=self.obj_type,
+            code_sample=code_sample,
+            file_type=file_type,
+            max_line_length=self.doc_str_line_length,
+        )
+
+    def format_docstring(
+        self,
+        doc_str: str,
+        allowed_doc_str_fmt: str,
+        rep_doc_str_fmt: List[str],
+        indentation: str | None = None,
+    ) -> str:
+        return DocString.format_to_docstring(
+            doc_str,
+            allowed_doc_str_fmt,
+            rep_doc_str_fmt,
+            self.doc_str_indent_level,
+            len(allowed_doc_str_fmt),
+            indentation,
+        )
 
     def generate_docstring(
         self,
@@ -172,24 +234,11 @@ class CodeBlock:
             object_type=self.obj_type,
             code_sample=code_sample,
             file_type=file_type,
-            max_line_length=(
-                self.position.indent_level + 4 if self.obj_type != "module" else 0
-            ),
-        )
-
-        indent_level = (
-            self.position.indent_level + 4 if self.obj_type != "module" else 0
-        )
-
-        generated_doc_str = DocString.format_to_docstring(
-            doc_str,
-            allowed_doc_str_fmt,
-            rep_doc_str_fmt,
-            indent_level,
-            len(allowed_doc_str_fmt),
+            max_line_length=self.doc_str_line_length,
+            route=self.route,
         )
 
-        return generated_doc_str
+        return self.format_docstring(doc_str, allowed_doc_str_fmt, rep_doc_str_fmt)
 
     def add_docstring(self) -> None:
         pass
@@ -197,10 +246,162 @@ class CodeBlock:
     def reset_doc_str(self) -> None:
         self.doc_string = None
 
+    # longest chain of nested blocks below this one, leaves are 0
+    @property
+    def height(self) -> int:
+        return max((child.height + 1 for child in self.children), default=0)
+
+    @property
+    def line_count(self) -> int:
+        return self.position.body_end - self.position.declaration_start
+
+    # the model route the client's router picks for this block, if any
+    @property
+    def route(self) -> str | None:
+        return client.route_for(self.obj_type, self.line_count, self.height)
+
     def __repr__(self) -> str:
         return self.__class__.__name__ + " : " + self.name
 
 
+# one row per block, held as columns so a whole tree of parse results costs a
+# few machine ints per block instead of three objects each
+class BlockTable:
+    OBJ_TYPES = ("module", "class", "function")
+    COLUMNS = (
+        "indent_level",
+        "declaration_start",
+        "body_start",
+        "body_end",
+        "body_indent",
+        "doc_start",
+        "doc_end",
+        "doc_indent",
+        # row of the enclosing block, -1 for the module
+        "parent",
+    )
+
+    __slots__ = ("names", "name_ids", "obj_types", "_name_index") + COLUMNS
+
+    def __init__(self) -> None:
+        self.names: List[str] = []
+        self.name_ids = array("i")
+        self.obj_types = array("b")
+        self._name_index: Dict[str, int] = {}
+        # one per name in COLUMNS, which sort and pickling go through
+        self.indent_level: array = array("i")
+        self.declaration_start: array = array("i")
+        self.body_start: array = array("i")
+        self.body_end: array = array("i")
+        self.body_indent: array = array("i")
+        self.doc_start: array = array("i")
+        self.doc_end: array = array("i")
+        self.doc_indent: array = array("i")
+        self.parent: array = array("i")
+
+    def __len__(self) -> int:
+        return len(self.name_ids)
+
+    def __getstate__(self):
+        return (
+            self.names,
+            self.name_ids,
+            self.obj_types,
+            [getattr(self, column) for column in BlockTable.COLUMNS],
+        )
+
+    def __setstate__(self, state) -> None:
+        names, self.name_ids, self.obj_types, columns = state
+        self.names = [sys.intern(name) for name in names]
+        self._name_index = {name: index for index, name in enumerate(self.names)}
+        for column, values in zip(BlockTable.COLUMNS, columns):
+            setattr(self, column, values)
+
+    def _name_id(self, name: str) -> int:
+        if (name_id := self._name_index.get(name)) is None:
+            name_id = self._name_index[name] = len(self.names)
+            self.names.append(sys.intern(name))
+        return name_id
+
+    def append(
+        self,
+        name: str,
+        obj_type: str,
+        indent_level: int,
+        declaration_start: int,
+        body_start: int,
+        body_end: int,
+        body_indent: int = 0,
+        doc_start: int = -1,
+        doc_end: int = -1,
+        doc_indent: int = 0,
+        parent: int = -1,
+    ) -> None:
+        self.name_ids.append(self._name_id(name))
+        self.obj_types.append(BlockTable.OBJ_TYPES.index(obj_type))
+        self.indent_level.append(indent_level)
+        self.declaration_start.append(declaration_start)
+        self.body_start.append(body_start)
+        self.body_end.append(body_end)
+        self.body_indent.append(body_indent)
+        self.doc_start.append(doc_start)
+        self.doc_end.append(doc_end)
+        self.doc_indent.append(doc_indent)
+        self.parent.append(parent)
+
+    def sort(self) -> None:
+        order = sorted(range(len(self)), key=self.declaration_start.__getitem__)
+        for column in ("name_ids", "obj_types") + BlockTable.COLUMNS:
+            values = getattr(self, column)
+            sorted_values = array(values.typecode, map(values.__getitem__, order))
+            setattr(self, column, sorted_values)
+        new_rows = [0] * len(order)
+        for new_row, old_row in enumerate(order):
+            new_rows[old_row] = new_row
+        self.parent = array(
+            "i", (new_rows[parent] if parent >= 0 else -1 for parent in self.parent)
+        )
+
+    def name(self, index: int) -> str:
+        return self.names[self.name_ids[index]]
+
+    def obj_type(self, index: int) -> str:
+        return BlockTable.OBJ_TYPES[self.obj_types[index]]
+
+    def has_docstring(self, index: int) -> bool:
+        return self.doc_start[index] >= 0
+
+    def documented(self) -> Iterator[bool]:
+        return (doc_start >= 0 for doc_start in self.doc_start)
+
+    def code_block(self, index: int, lines: List[str]) -> CodeBlock:
+        code_block = CodeBlock(
+            self.name(index),
+            self.obj_type(index),
+            CodePosition(
+                declaration_start=self.declaration_start[index],
+                indent_level=self.indent_level[index],
+                body_start=self.body_start[index],
+                body_end=self.body_end[index],
+                body_indent=self.body_indent[index],
+            ),
+        )
+        if self.has_docstring(index):
+            doc_start, doc_end = self.doc_start[index], self.doc_end[index]
+            code_block.doc_string = DocString(
+                lines[doc_start:doc_end],
+                Position(self.doc_indent[index], doc_start, doc_end),
+            )
+        return code_block
+
+    def code_blocks(self, lines: List[str]) -> List[CodeBlock]:
+        code_blocks = [self.code_block(index, lines) for index in range(len(self))]
+        for code_block, parent in zip(code_blocks, self.parent):
+            if parent >= 0:
+                code_blocks[parent].children.append(code_block)
+        return code_blocks
+
+
 class Module:
     def __init__(
         self,
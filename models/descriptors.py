@@ -0,0 +1,18 @@
+from typing import NamedTuple
+
+from models.blocks import BlockTable
+
+
+class FileDescriptor(NamedTuple):
+    file_name: str
+    sha256: str
+    # pickles as a handful of int arrays, cheap to send back from the pool
+    blocks: BlockTable
+    parse_seconds: float
+
+    def needs_work(self, replace_docs: bool, remove_docs: bool) -> bool:
+        if replace_docs:
+            return bool(len(self.blocks))
+        if remove_docs:
+            return any(self.blocks.documented())
+        return not all(self.blocks.documented())
@@ -1,7 +1,52 @@
 import abc
-from typing import List, Callable
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+from typing import Callable, Dict, Iterable, List, Tuple
 
-from models.blocks import CodeBlock
+from core.console import safe_print
+from models.blocks import BlockTable, CodeBlock
+from models.descriptors import FileDescriptor
+from parsers.edits import EditList
+
+
+def hash_source(content: str) -> str:
+    return hashlib.sha256(content.encode("utf8")).hexdigest()
+
+
+_LINE = re.compile(r"[^\n]*\n|[^\n]+$")
+
+
+# only at "\n" like ast does, str.splitlines also breaks at form feeds and
+# unicode separators, which would shift every line number after them
+def split_lines(source: str) -> List[str]:
+    return _LINE.findall(source)
+
+
+def detect_newline(newlines: str | Tuple[str, ...] | None) -> str:
+    # io reports a tuple for mixed line endings, those are written as "\n"
+    return newlines if isinstance(newlines, str) else "\n"
+
+
+# written next to the target and swapped in, a crash never truncates it
+def write_atomic(file_name: str, lines: Iterable[str], newline: str = "\n") -> None:
+    target = os.path.realpath(file_name)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(target), prefix=".auto_doc_", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w", encoding="utf8", newline=newline) as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        shutil.copymode(target, tmp_path)
+        os.replace(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
 
 
 class BaseParser(metaclass=abc.ABCMeta):
@@ -11,11 +56,13 @@ class BaseParser(metaclass=abc.ABCMeta):
         pass
 
     @abc.abstractmethod
-    def remove_doc_strings(self) -> None:
+    def remove_doc_strings(
+        self, keep_bodies: bool = True, code_blocks: List[CodeBlock] | None = None
+    ) -> None:
         pass
 
     @abc.abstractmethod
-    def embed_documentation(self) -> None:
+    def embed_documentation(self, code_blocks: List[CodeBlock] | None = None) -> None:
         pass
 
     @abc.abstractmethod
@@ -39,7 +86,11 @@ class Parser(BaseParser):
         self.file_name = file_name
         self.file_type = file_type
         self.lines = []
-        self.code_blocks = []
+        self.block_table = BlockTable()
+        self._code_blocks: List[CodeBlock] | None = None
+        self.edits = EditList()
+        self.source_hash = ""
+        self.newline = "\n"
         self.allowed_doc_str_fmt = ""
         self.rep_doc_str_fmt: List[str] = []
 
@@ -51,23 +102,134 @@ class Parser(BaseParser):
     def lines(self, lines: List[str]) -> None:
         self._lines = lines
 
+    # parsers fill the table, block objects are only built once something
+    # needs to edit them
     @property
     def code_blocks(self) -> List[CodeBlock]:
+        if self._code_blocks is None:
+            self._code_blocks = self.block_table.code_blocks(self.lines)
         return self._code_blocks
 
     @code_blocks.setter
     def code_blocks(self, code_blocks: List[CodeBlock]) -> None:
         self._code_blocks = code_blocks
 
+    def load_blocks(self, block_table: BlockTable) -> None:
+        self.block_table = block_table
+        self._code_blocks = None
+
+    # blocks parsed earlier from the same content, e.g. by the daemon's cache
+    def load_source(
+        self, source: str, block_table: BlockTable, source_hash: str | None = None
+    ) -> None:
+        self.lines = split_lines(source)
+        self.source_hash = source_hash or hash_source(source)
+        self.load_blocks(block_table)
+
     def parse_file(self) -> None:
         raise NotImplementedError("parse_file not implemented")
 
-    def embed_documentation(self) -> None:
-        print(f"Documentation embedded successfully for {self.file_name}")
+    def parse_source(self, source: str) -> None:
+        raise NotImplementedError("parse_source not implemented")
+
+    # Hash of each block's own lines, keyed by its nesting path. An edit inside
+    # a method changes the method's fingerprint but not the class's.
+    def block_fingerprints(self) -> Dict[str, Tuple[str, CodeBlock]]:
+        nested = set()
+        for code_block in self.code_blocks:
+            nested.update(code_block.children)
+
+        fingerprints: Dict[str, Tuple[str, CodeBlock]] = {}
+        stack = [
+            ("", code_block)
+            for code_block in self.code_blocks
+            if code_block not in nested
+        ]
+        while stack:
+            prefix, code_block = stack.pop()
+            key = f"{prefix}/{code_block.obj_type}:{code_block.name}"
+            # overloads and property setters share a name
+            while key in fingerprints:
+                key += "'"
+            fingerprints[key] = (self._block_hash(code_block), code_block)
+            stack.extend((key, child) for child in reversed(code_block.children))
+        return fingerprints
+
+    # blocks whose own lines overlap any of the zero based, end exclusive ranges
+    def blocks_touching(self, line_ranges: List[Tuple[int, int]]) -> List[CodeBlock]:
+        return [
+            code_block
+            for code_block in self.code_blocks
+            if any(
+                start < range_end and range_start < end
+                for start, end in self._own_lines(code_block)
+                for range_start, range_end in line_ranges
+            )
+        ]
+
+    # a block's lines without its docstring or the bodies of nested blocks
+    def _own_lines(self, code_block: CodeBlock) -> List[Tuple[int, int]]:
+        skipped = [
+            (child.position.body_start, child.position.body_end)
+            for child in code_block.children
+        ]
+        if code_block.doc_string is not None:
+            position = code_block.doc_string.position
+            skipped.append((position.body_start, position.body_end))
+        own_lines = []
+        cursor = code_block.position.declaration_start
+        for start, end in sorted(skipped):
+            if start > cursor:
+                own_lines.append((cursor, start))
+            cursor = max(cursor, end)
+        if cursor < code_block.position.body_end:
+            own_lines.append((cursor, code_block.position.body_end))
+        return own_lines
+
+    def _block_hash(self, code_block: CodeBlock) -> str:
+        return hash_source(
+            "".join(
+                "".join(self.lines[start:end])
+                for start, end in self._own_lines(code_block)
+            )
+        )
+
+    def describe(self, parse_seconds: float = 0.0) -> FileDescriptor:
+        raise NotImplementedError("describe not implemented")
+
+    def load_descriptor(self, descriptor: FileDescriptor) -> bool:
+        return False
+
+    def embed_documentation(self, code_blocks: List[CodeBlock] | None = None) -> None:
+        safe_print(f"Documentation embedded successfully for {self.file_name}")
+
+    def plan_documentation(
+        self, code_blocks: List[CodeBlock] | None = None
+    ) -> List[Tuple[str, str, str | None]]:
+        raise NotImplementedError("plan_documentation not implemented")
+
+    def insert_docstring(self, code_block: CodeBlock, doc_string: str) -> None:
+        raise NotImplementedError("insert_docstring not implemented")
+
+    def apply_edits(self) -> None:
+        if len(self.edits):
+            self.lines = self.edits.apply(self.lines)
+            self.edits.clear()
 
     def write_to_file(self) -> None:
-        with open(self.file_name, "w", encoding="utf8") as f:
-            f.writelines(self.lines)
+        self.apply_edits()
+        content = "".join(self.lines)
+        # untouched files keep their mtime, so build and test caches stay valid
+        if hash_source(content) == self.source_hash:
+            return
+
+        self.validate(content)
+        write_atomic(self.file_name, self.lines, self.newline)
+        self.source_hash = hash_source(content)
+
+    # raises ValueError for output that must not replace the source
+    def validate(self, content: str) -> None:
+        pass
 
     def _get_indentation_level(self, line: str) -> int:
         return len(line) - len(line.lstrip())
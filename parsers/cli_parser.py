@@ -19,6 +19,81 @@ def cli_parser() -> Tuple[argparse.Namespace, argparse.ArgumentParser]:
         default=4,
         help="Specify max number of workers",
     )
+    parser.add_argument(
+        "-P",
+        dest="parse_workers",
+        type=int,
+        required=False,
+        help="Specify number of parsing processes, 0 parses in the worker threads",
+    )
+    parser.add_argument(
+        "--queue-size",
+        dest="max_pending_files",
+        type=int,
+        required=False,
+        default=256,
+        help="Specify how many files may be in flight before the walk waits",
+    )
+    parser.add_argument(
+        "--include",
+        dest="include",
+        action="append",
+        help="Only process files matching this glob, may be repeated",
+    )
+    parser.add_argument(
+        "--exclude",
+        dest="exclude",
+        action="append",
+        help="Skip files and directories matching this glob, may be repeated",
+    )
+    parser.add_argument(
+        "-C",
+        dest="max_concurrent_requests",
+        type=int,
+        required=False,
+        default=8,
+        help="Specify max number of concurrent requests per file",
+    )
+    parser.add_argument(
+        "--batch-tokens",
+        dest="batch_token_budget",
+        type=int,
+        required=False,
+        default=2000,
+        help="Specify the prompt token budget for batching blocks, 0 disables",
+    )
+    parser.add_argument(
+        "--prompt-tokens",
+        dest="prompt_token_budget",
+        type=int,
+        required=False,
+        default=1000,
+        help="Specify the most code tokens sent for one block, 0 disables",
+    )
+    parser.add_argument(
+        "--rpm",
+        dest="requests_per_minute",
+        type=int,
+        required=False,
+        default=0,
+        help="Specify the shared requests per minute limit, 0 for none",
+    )
+    parser.add_argument(
+        "--tpm",
+        dest="tokens_per_minute",
+        type=int,
+        required=False,
+        default=0,
+        help="Specify the shared tokens per minute limit, 0 for none",
+    )
+    parser.add_argument(
+        "--max-retries",
+        dest="max_retries",
+        type=int,
+        required=False,
+        default=5,
+        help="Specify how often a failed or rate limited request is retried",
+    )
     parser.add_argument(
         "--r",
         dest="replace_docs",
@@ -38,6 +113,176 @@ def cli_parser() -> Tuple[argparse.Namespace, argparse.ArgumentParser]:
         action="store_true",
         help="Remove all documentation in file",
     )
+    parser.add_argument(
+        "--dry-run",
+        dest="dry_run",
+        action="store_true",
+        help="Report what would change without calling the model or writing",
+    )
+    parser.add_argument(
+        "--incremental",
+        dest="incremental",
+        action="store_true",
+        help="Skip files unchanged since the last run in the target directory",
+    )
+    parser.add_argument(
+        "--full",
+        dest="full_rebuild",
+        action="store_true",
+        help="Ignore the incremental manifest and reprocess every file",
+    )
+    parser.add_argument(
+        "--since",
+        dest="since",
+        type=str,
+        required=False,
+        help="Only document blocks changed since this git revision",
+    )
+    parser.add_argument(
+        "--staged",
+        dest="staged",
+        action="store_true",
+        help="Only document blocks touched by the staged git changes, files with "
+        "unstaged changes are skipped",
+    )
+    parser.add_argument(
+        "--watch",
+        dest="watch",
+        action="store_true",
+        help="Keep running and document files as they are saved",
+    )
+    parser.add_argument(
+        "--debounce",
+        dest="watch_debounce",
+        type=float,
+        required=False,
+        default=0.3,
+        help="Specify the seconds of quiet --watch waits for after a save",
+    )
+    parser.add_argument(
+        "--poll",
+        dest="watch_poll",
+        action="store_true",
+        help="Scan for changes instead of using inotify in --watch mode",
+    )
+    parser.add_argument(
+        "--serve",
+        dest="serve",
+        action="store_true",
+        help="Run as a daemon answering documentation requests, see core.remote",
+    )
+    parser.add_argument(
+        "--socket",
+        dest="socket_path",
+        type=str,
+        required=False,
+        help="Specify the Unix socket --serve listens on, defaults to $AUTO_DOC_SOCKET",
+    )
+    parser.add_argument(
+        "--port",
+        dest="port",
+        type=int,
+        required=False,
+        help="Serve on this localhost port instead of a Unix socket",
+    )
+    parser.add_argument(
+        "--plan",
+        dest="plan_path",
+        type=str,
+        required=False,
+        help="Write the blocks to document and their prompts to a job file",
+    )
+    parser.add_argument(
+        "--execute",
+        dest="execute_path",
+        type=str,
+        required=False,
+        help="Complete the prompts in a job file, resuming a stopped run",
+    )
+    parser.add_argument(
+        "--apply",
+        dest="apply_path",
+        type=str,
+        required=False,
+        help="Write the completed docstrings in a job file into their files",
+    )
+    parser.add_argument(
+        "--batch",
+        dest="batch",
+        action="store_true",
+        help="Complete the job file through the backend's batch endpoint",
+    )
+    parser.add_argument(
+        "--backend",
+        dest="backend",
+        type=str,
+        required=False,
+        default="openai",
+        help="Specify the model backend, 'openai' or 'fake[:OPTIONS]'",
+    )
+    parser.add_argument(
+        "--base-url",
+        dest="base_url",
+        type=str,
+        required=False,
+        help="Specify an OpenAI compatible endpoint, e.g. the local stand-in server",
+    )
+    parser.add_argument(
+        "--routes",
+        dest="routes_path",
+        type=str,
+        required=False,
+        help="Route blocks to models and endpoints by the rules in a JSON file",
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="no_cache",
+        action="store_true",
+        help="Always request fresh docs instead of reusing cached responses",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        dest="cache_dir",
+        type=str,
+        required=False,
+        help="Specify the response cache directory",
+    )
+    parser.add_argument(
+        "--metrics",
+        dest="metrics_path",
+        type=str,
+        required=False,
+        help="Write a JSON summary of timings, requests and tokens to a file",
+    )
+    parser.add_argument(
+        "--prometheus",
+        dest="prometheus_path",
+        type=str,
+        required=False,
+        help="Write metrics in the Prometheus textfile format to a file",
+    )
+    parser.add_argument(
+        "--profile",
+        dest="profile_dir",
+        type=str,
+        required=False,
+        help="Profile each file and write reports for the slowest to a directory,"
+        " parsing is only included with -P 0",
+    )
+    parser.add_argument(
+        "--profile-sample",
+        dest="profile_sample",
+        type=float,
+        required=False,
+        default=1.0,
+        help="Specify the fraction of files --profile samples",
+    )
+    parser.add_argument(
+        "--profile-memory",
+        dest="profile_memory",
+        action="store_true",
+        help="Also trace allocations per profiled file, slows every file down",
+    )
     parser.add_argument(
         "--cmd",
         dest="command",
@@ -0,0 +1,64 @@
+from bisect import bisect_left
+from dataclasses import dataclass
+from typing import List, Sequence
+
+
+@dataclass
+class Edit:
+    start: int
+    end: int
+    replacement: List[str]
+
+
+# Edits replace the half open range [start, end) of the original lines, so
+# positions never need patching as earlier edits are recorded. Inserts are
+# empty ranges and land before a removal starting on the same line.
+class EditList:
+    def __init__(self) -> None:
+        self._edits: List[Edit] = []
+        self._starts: List[int] = []
+        self._sorted = True
+
+    def __len__(self) -> int:
+        return len(self._edits)
+
+    def replace(self, start: int, end: int, replacement: Sequence[str]) -> None:
+        self._edits.append(Edit(start, end, list(replacement)))
+        self._sorted = False
+
+    def insert(self, index: int, lines: Sequence[str]) -> None:
+        self.replace(index, index, lines)
+
+    def remove(self, start: int, end: int) -> None:
+        self.replace(start, end, [])
+
+    def _sort(self) -> None:
+        if not self._sorted:
+            # stable, so inserts at the same line keep their recorded order
+            self._edits.sort(key=lambda edit: (edit.start, edit.end))
+            self._starts = [edit.start for edit in self._edits]
+            self._sorted = True
+
+    def apply(
+        self, lines: List[str], start: int = 0, end: int | None = None
+    ) -> List[str]:
+        self._sort()
+        end = len(lines) if end is None else end
+        output: List[str] = []
+        cursor = start
+        for index in range(bisect_left(self._starts, start), len(self._edits)):
+            edit = self._edits[index]
+            if edit.start > end or (edit.start == end and edit.end > end):
+                break
+            if edit.start > cursor:
+                output.extend(lines[cursor : edit.start])
+            output.extend(edit.replacement)
+            cursor = max(cursor, edit.end)
+        if cursor < end:
+            output.extend(lines[cursor:end])
+        return output
+
+    def clear(self) -> None:
+        self._edits = []
+        self._starts = []
+        self._sorted = True
@@ -0,0 +1,72 @@
+from textwrap import dedent
+from typing import Dict, List
+
+from client.batching import estimate_tokens
+from models.blocks import CodeBlock, summarize_docstring
+from parsers.edits import EditList
+
+
+# Builds the code sample sent for each block. Every block is sent as an
+# outline, its own statements with each nested block reduced to its signature
+# and docstring summary, since those get requests of their own. Anything still
+# over the token budget is cut off with a note.
+class PromptBuilder:
+    placeholder = "..."
+    truncation_note = "# ... {} more lines"
+
+    def __init__(
+        self,
+        lines: List[str],
+        edits: EditList,
+        token_budget: int,
+        doc_str_fmt: str = '"""',
+    ) -> None:
+        self.lines = lines
+        self.edits = edits
+        self.token_budget = token_budget
+        self.doc_str_fmt = doc_str_fmt
+        # docstrings generated earlier in the run, ahead of any on disk
+        self.summaries: Dict[CodeBlock, str] = {}
+
+    def add_summary(self, code_block: CodeBlock, doc_string: str) -> None:
+        self.summaries[code_block] = summarize_docstring(doc_string)
+
+    def _summarize(self, code_block: CodeBlock) -> str:
+        line = self.lines[code_block.position.body_start]
+        indent = line[: len(line) - len(line.lstrip())]
+        summary = self.summaries.get(code_block)
+        if summary is None and code_block.doc_string is not None:
+            summary = code_block.doc_string.summary()
+        if summary:
+            return f"{indent}{self.doc_str_fmt}{summary}{self.doc_str_fmt}\n"
+        return f"{indent}{self.placeholder}\n"
+
+    def _outline(self, code_block: CodeBlock) -> List[str]:
+        sample: List[str] = []
+        cursor = code_block.position.declaration_start
+        for child in code_block.children:
+            child_start = child.position.body_start
+            sample.extend(self.edits.apply(self.lines, cursor, child_start))
+            sample.append(self._summarize(child))
+            cursor = child.position.body_end
+        end = code_block.position.body_end
+        sample.extend(self.edits.apply(self.lines, cursor, end))
+        return sample
+
+    def _truncate(self, sample: List[str], indent: int) -> List[str]:
+        if self.token_budget <= 0:
+            return sample
+        used = 0
+        for count, line in enumerate(sample):
+            used += estimate_tokens(line)
+            if used > self.token_budget:
+                count = max(count, 1)
+                note = self.truncation_note.format(len(sample) - count)
+                return sample[:count] + [" " * indent + note + "\n"]
+        return sample
+
+    def sample(self, code_block: CodeBlock) -> str:
+        sample = self._truncate(
+            self._outline(code_block), code_block.doc_str_indent_level
+        )
+        return dedent("".join(sample))
@@ -1,13 +1,15 @@
 import ast
 import re
-from typing import List, Callable
+import time
+from typing import Callable, Dict, List, Tuple
 
-from models.blocks import CodeBlock, DocString, Position, CodePosition
-from parsers.base_parser import Parser
-
-
-def dec_end_check(lines: List[str], line_num: int, check: str) -> bool:
-    return lines[line_num].endswith(check)
+from core import settings
+from core.console import safe_print
+from core.embeder import DocstringManager
+from models.blocks import BlockTable, CodeBlock, CodePosition, DocString, Position
+from models.descriptors import FileDescriptor
+from parsers.base_parser import Parser, detect_newline, hash_source, split_lines
+from parsers.prompt_builder import PromptBuilder
 
 
 def get_ast_doc_str(ast_code_block: ast.AST | ast.Module) -> str | None:
@@ -21,6 +23,9 @@ def check_ast_doc_str(ast_code_block: ast.AST) -> Callable[[], bool]:
     return has_docstring
 
 
+AstBlock = ast.FunctionDef | ast.AsyncFunctionDef | ast.ClassDef
+
+
 class PythonParser(Parser):
     AST_TYPES = {
         ast.FunctionDef: "function",
@@ -29,7 +34,14 @@ class PythonParser(Parser):
         ast.Module: "module",
     }
 
-    def __init__(self, file_name: str, module_doc: bool = False) -> None:
+    def __init__(
+        self,
+        file_name: str,
+        module_doc: bool = False,
+        max_concurrent_requests: int = settings.MAX_CONCURRENT_REQUESTS,
+        batch_token_budget: int = settings.BATCH_TOKEN_BUDGET,
+        prompt_token_budget: int = settings.PROMPT_TOKEN_BUDGET,
+    ) -> None:
         super().__init__(file_name, "Python")
         self.allowed_doc_str_fmt = '"""'
         self.rep_doc_str_fmt = [
@@ -38,171 +50,245 @@ class PythonParser(Parser):
             "```",
         ]
         self.module_doc = module_doc
+        self.max_concurrent_requests = max_concurrent_requests
+        self.batch_token_budget = batch_token_budget
+        self.prompt_token_budget = prompt_token_budget
 
     @property
     def chars_skip(self) -> int:
         return len(self.allowed_doc_str_fmt)
 
     def parse_file(self) -> None:
-        with open(self.file_name, "r+", encoding="utf8") as file:
+        with open(self.file_name, "r", encoding="utf8") as file:
             file_content = file.read()
-            tree = ast.parse(file_content, filename=self.file_name)
-            self.lines = file_content.splitlines(keepends=True)
-
-        self._process_ast_tree(tree=tree, lines=self.lines)
-        self.code_blocks.sort(
-            key=lambda code_block: code_block.position.declaration_start
+            self.newline = detect_newline(file.newlines)
+        self.parse_source(file_content)
+
+    def parse_source(self, file_content: str) -> None:
+        tree = ast.parse(file_content, filename=self.file_name)
+        lines = split_lines(file_content)
+        block_table = BlockTable()
+        self._process_ast_tree(tree=tree, lines=lines, block_table=block_table)
+        block_table.sort()
+        self.load_source(file_content, block_table)
+
+    def describe(self, parse_seconds: float = 0.0) -> FileDescriptor:
+        return FileDescriptor(
+            self.file_name, self.source_hash, self.block_table, parse_seconds
         )
 
-    def embed_documentation(self) -> None:
-        code_blocks = self.code_blocks[::-1]
-        for code_block in code_blocks:
-            if code_block.doc_string is not None:
-                continue
-            code_sample = "".join(
-                self.lines[
-                    code_block.position.declaration_start : code_block.position.body_end
-                ]
+    def load_descriptor(self, descriptor: FileDescriptor) -> bool:
+        with open(self.file_name, "r", encoding="utf8") as file:
+            file_content = file.read()
+            self.newline = detect_newline(file.newlines)
+        # edited since it was parsed, the caller has to parse it again
+        if hash_source(file_content) != descriptor.sha256:
+            return False
+
+        self.load_source(file_content, descriptor.blocks, descriptor.sha256)
+        return True
+
+    # Nested blocks are documented first, each wave holds the pending blocks of
+    # one height and runs concurrently, so a parent's prompt carries the
+    # summaries of its children's new docstrings instead of their source.
+    def embed_documentation(self, code_blocks: List[CodeBlock] | None = None) -> None:
+        waves: Dict[int, List[CodeBlock]] = {}
+        for code_block in self.code_blocks if code_blocks is None else code_blocks:
+            if code_block.doc_string is None:
+                waves.setdefault(code_block.height, []).append(code_block)
+        # samples reflect pending removals, so --r never sends the old docstrings
+        prompt_builder = PromptBuilder(
+            self.lines, self.edits, self.prompt_token_budget, self.allowed_doc_str_fmt
+        )
+        inserts = []
+        for height in sorted(waves):
+            pending = waves[height]
+            doc_str_prompts = [
+                code_block.build_prompt(
+                    prompt_builder.sample(code_block), self.file_type
+                )
+                for code_block in pending
+            ]
+            responses = DocString.generate_docstrings(
+                doc_str_prompts,
+                self.max_concurrent_requests,
+                self.batch_token_budget,
+                settings.BATCH_MAX_BLOCKS,
+                [code_block.route for code_block in pending],
             )
-            doc_string = code_block.generate_docstring(
-                code_sample,
-                self.file_type,
-                self.allowed_doc_str_fmt,
-                self.rep_doc_str_fmt,
+            for code_block, response in zip(pending, responses):
+                prompt_builder.add_summary(code_block, response)
+                inserts.append((code_block, response))
+
+        # recorded once every sample is built, samples never include new docstrings
+        for code_block, response in inserts:
+            self.insert_docstring(code_block, response)
+        super().embed_documentation(code_blocks)
+
+    # The prompt and route of every block missing a docstring, keyed by its
+    # nesting path, for a job file to complete later. All prompts are built up
+    # front, so they carry the docstrings already on disk but not the ones
+    # generated for nested blocks in the same run.
+    def plan_documentation(
+        self, code_blocks: List[CodeBlock] | None = None
+    ) -> List[Tuple[str, str, str | None]]:
+        selected = None if code_blocks is None else set(code_blocks)
+        prompt_builder = PromptBuilder(
+            self.lines, self.edits, self.prompt_token_budget, self.allowed_doc_str_fmt
+        )
+        return [
+            (
+                key,
+                code_block.build_prompt(
+                    prompt_builder.sample(code_block), self.file_type
+                ),
+                code_block.route,
             )
-            self.lines.insert(code_block.position.body_start, doc_string)
-        super().embed_documentation()
-
-    def remove_doc_strings(self) -> None:
-        lines_removed = 0
-
-        module_code_block_ref: None | CodeBlock = None
-        for code_block in self.code_blocks:
-            if code_block.obj_type == "module":
-                module_code_block_ref = code_block
+            for key, (_, code_block) in self.block_fingerprints().items()
+            if code_block.doc_string is None
+            and (selected is None or code_block in selected)
+        ]
 
-            code_block.position.declaration_start = (
-                code_block.position.declaration_start - lines_removed
-            )
-            code_block.position.body_start = code_block.position.body_start - lines_removed  # type: ignore
-            code_block.position.body_end = code_block.position.body_end - lines_removed
+    def insert_docstring(self, code_block: CodeBlock, doc_string: str) -> None:
+        # the body's own indentation, tabs included
+        body_line = self.lines[code_block.position.body_start]
+        self.edits.insert(
+            code_block.position.body_start,
+            [
+                code_block.format_docstring(
+                    doc_string,
+                    self.allowed_doc_str_fmt,
+                    self.rep_doc_str_fmt,
+                    body_line[: code_block.doc_str_indent_level],
+                )
+            ],
+        )
 
+    def remove_doc_strings(
+        self, keep_bodies: bool = True, code_blocks: List[CodeBlock] | None = None
+    ) -> None:
+        selected = self.code_blocks if code_blocks is None else code_blocks
+        if not any(code_block.doc_string is not None for code_block in selected):
+            return
+        # the lines each docstring can be cut at, as -R finds them
+        spans = (
+            DocstringManager(self.file_name)
+            .find_doc_strings("".join(self.lines), self.lines)
+            .by_start()
+        )
+        for code_block in selected:
             if code_block.doc_string is None:
                 continue
 
-            doc_str_obj = code_block.doc_string
-            if doc_str_obj.position is None:  # type: ignore
-                print(
-                    f"Error in removing docstring for {code_block.name} {self.file_name}"
+            doc_position = code_block.doc_string.position
+            span = spans.get(doc_position.body_start)
+            if span is None:
+                safe_print(
+                    f"Skipping docstring of {code_block.name} in {self.file_name}: "
+                    "it shares a line with other code"
                 )
-                break
-
-            doc_start = doc_str_obj.position.body_start  # type: ignore
-            doc_str_len = len(doc_str_obj)  # type: ignore
-            code_block.position.body_end = code_block.position.body_end - doc_str_len
-
-            cursor = doc_start - lines_removed
-            if not self.lines[cursor].strip().startswith('"""'):
-                print("Error removing", code_block.name)
                 continue
 
-            # refactor this to avoid loops
-            for _ in range(doc_str_len, 0, -1):
-                self.lines.pop(cursor)
-                lines_removed += 1
-            code_block.reset_doc_str()
-
-        if module_code_block_ref is not None:
-            module_code_block_ref.position.body_end = len(self.lines)
-
-    def _process_ast_tree(self, tree: ast.AST, lines: List[str]) -> None:
-        for ast_node in ast.walk(tree):
-            if not isinstance(
-                ast_node,
-                tuple(PythonParser.AST_TYPES.keys()),
-            ):
-                continue
-
-            if (ast_node_type := PythonParser.AST_TYPES[type(ast_node)]) == "module":
-                setattr(ast_node, "name", self.file_name)
-                ast_node.lineno = 0
-                ast_node.end_lineno = len(lines)
+            # a docstring that is the whole body leaves a `pass` behind, unless a
+            # new docstring is about to take its place
+            if keep_bodies and span.replacement is not None:
+                self.edits.replace(span.start, span.end, [span.replacement])
             else:
-                ast_node.end_lineno += 1  # type: ignore
+                self.edits.remove(span.start, span.end)
+            code_block.reset_doc_str()
 
-            if ast_node.lineno is None or ast_node.end_lineno is None:
-                print(f"Error Attempting to parse {self.file_name}")
-                print(
-                    f"""ast_node {ast_node.name} of type {
-                        ast_node_type} does not contain start or endline"""
+    def validate(self, content: str) -> None:
+        try:
+            ast.parse(content, filename=self.file_name)
+        except SyntaxError as e:
+            raise ValueError(f"Documented source does not parse, not written: {e}")
+
+    # walks depth first so every block records the block it is nested in,
+    # the containment tree that documentation is scheduled along
+    def _process_ast_tree(
+        self, tree: ast.AST, lines: List[str], block_table: BlockTable
+    ) -> None:
+        stack: List[Tuple[ast.AST, int]] = [(tree, -1)]
+        while stack:
+            ast_node, parent = stack.pop()
+            if isinstance(ast_node, tuple(PythonParser.AST_TYPES.keys())):
+                parent = self._add_block(ast_node, lines, block_table, parent)
+            stack.extend((child, parent) for child in ast.iter_child_nodes(ast_node))
+
+    def _add_block(
+        self, ast_node: ast.AST, lines: List[str], block_table: BlockTable, parent: int
+    ) -> int:
+        if (ast_node_type := PythonParser.AST_TYPES[type(ast_node)]) == "module":
+            name = self.file_name
+            code_position = self._get_module_pos(lines)
+        else:
+            if self._has_inline_body(ast_node, lines):  # type: ignore
+                safe_print(
+                    f"Skipping {ast_node.name} in {self.file_name}: "  # type: ignore
+                    "body shares a line with its declaration"
                 )
-                continue
+                return parent
+            name = ast_node.name  # type: ignore
+            code_position = self._get_code_block_pos(ast_node)  # type: ignore
+
+        doc_position = Position(0, -1, -1)
+        if get_ast_doc_str(ast_node) is not None:
+            doc_position = self._get_doc_str_pos(ast_node)  # type: ignore
+
+        block_table.append(
+            name,
+            ast_node_type,
+            code_position.indent_level,
+            code_position.declaration_start,
+            code_position.body_start,
+            code_position.body_end,
+            code_position.body_indent,
+            doc_position.body_start,
+            doc_position.body_end,
+            doc_position.indent_level,
+            parent,
+        )
+        return len(block_table) - 1
+
+    def _get_module_pos(self, lines: List[str]) -> CodePosition:
+        pattern = re.compile(r"^#!.+")
+        body_start = 1 if lines and pattern.match(lines[0]) else 0
+        return CodePosition(
+            declaration_start=0,
+            indent_level=0,
+            body_start=body_start,
+            body_end=len(lines),
+        )
 
-            dec_start, body_start, end_line = self._get_code_block_pos(ast_node)
-            indent_level = getattr(ast_node, "col_offset", 0)
+    def _has_inline_body(self, ast_node: AstBlock, lines: List[str]) -> bool:
+        # e.g. `def f(): pass`, there is no line to insert a docstring before
+        first_stmt = ast_node.body[0]
+        return bool(lines[first_stmt.lineno - 1][: first_stmt.col_offset].strip())
 
-            code_position = CodePosition(
-                declaration_start=dec_start,
-                indent_level=indent_level,
-                body_start=body_start,
-                body_end=end_line,
-            )
-            new_code_block = CodeBlock(
-                ast_node.name, ast_node_type, code_position  # type: ignore
-            )
+    def _get_code_block_pos(self, ast_node: AstBlock) -> CodePosition:
+        declaration_start = min(
+            [ast_node.lineno] + [dec.lineno for dec in ast_node.decorator_list]
+        )
+        return CodePosition(
+            declaration_start=declaration_start - 1,
+            indent_level=ast_node.col_offset,
+            body_start=ast_node.body[0].lineno - 1,
+            body_end=ast_node.end_lineno,  # type: ignore
+            body_indent=ast_node.body[0].col_offset,
+        )
+
+    def _get_doc_str_pos(self, ast_node: AstBlock | ast.Module) -> Position:
+        doc_node = ast_node.body[0]
+        return Position(
+            indent_level=doc_node.col_offset,
+            body_start=doc_node.lineno - 1,
+            body_end=doc_node.end_lineno,  # type: ignore
+        )
 
-            code_block_doc_string: str | None = (
-                get_ast_doc_str(ast_node)
-                if ast_node_type != "module"
-                else get_ast_doc_str(tree)
-            )
-            if code_block_doc_string is not None:
-                new_code_block.doc_string = DocString(
-                    code_block_doc_string,
-                    Position(
-                        (
-                            indent_level + 4
-                            if ast_node_type != "module"
-                            else indent_level
-                        ),
-                        *self._get_doc_str_index(new_code_block),
-                    ),
-                )
 
-            self.code_blocks.append(new_code_block)
-
-    def _get_code_block_pos(self, code_block: ast.AST) -> tuple[int, int, int]:
-        if PythonParser.AST_TYPES[type(code_block)] == "module":
-            pattern = re.compile(r"^#!.+")
-            body_start: int | None = 1 if pattern.match(self.lines[0]) else 0
-            return (code_block.lineno, body_start, code_block.end_lineno)  # type: ignore
-
-        declaration_start = code_block.lineno - 1
-        body_start = None
-        end_line = code_block.end_lineno - 1  # type: ignore
-
-        for index in range(declaration_start, end_line):
-            if dec_end_check(self.lines, index, ":\n"):
-                body_start = index + 1
-                break
-        if body_start is None:
-            body_start = code_block.lineno
-
-        return (declaration_start, body_start, end_line)
-
-    def _get_doc_str_index(self, code_block: CodeBlock) -> tuple[int, int]:
-        start_index, last_index = None, None
-        for index in range(code_block.position.body_start, len(self.lines)):
-            if start_index is None and self.lines[index].strip().startswith(
-                self.allowed_doc_str_fmt
-            ):
-                start_index = index
-            elif start_index is not None and self.lines[index].strip().startswith(
-                self.allowed_doc_str_fmt
-            ):
-                last_index = index + 1
-                break
-        if start_index is None or last_index is None:
-            raise ValueError(f'Unable to locate docstring for {code_block.name}')
-
-        return (start_index, last_index)
+# process pool entry point, only the compact descriptor crosses back
+def describe_file(file_name: str) -> FileDescriptor:
+    start = time.perf_counter()
+    parser = PythonParser(file_name)
+    parser.parse_file()
+    return parser.describe(time.perf_counter() - start)